@@ -17,6 +17,13 @@ class Config:
     HOST = os.environ.get('HOST', '0.0.0.0')
     PORT = int(os.environ.get('PORT', 5000))
     
+    # Production server (gunicorn) settings; crowd validations live in process
+    # memory and one process owns their log, so the server runs a single worker
+    # and scales with threads
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', (os.cpu_count() or 1) * 2))
+    # Load data when the app module is imported, so gunicorn --preload shares it with the worker
+    PRELOAD_DATA = os.environ.get('PRELOAD_DATA', 'False').lower() == 'true'
+    
     # Data settings
     DATA_DIR = os.environ.get('DATA_DIR', '.')
     CACHE_DURATION = int(os.environ.get('CACHE_DURATION', 300))  # 5 minutes
@@ -5,119 +5,430 @@ Handles user confirmations and crowd-based train status adjustments
 """
 
 import logging
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
-import json
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime
+from operator import itemgetter
+import atexit
 import os
 import random
+import threading
+import time
+
+import json_utils
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Compact the event log into the snapshot once it exceeds this many times
+# the snapshot size (with a floor so tiny snapshots don't compact constantly)
+COMPACT_LOG_RATIO = 10
+COMPACT_MIN_LOG_BYTES = 64 * 1024
+
+# Confirmations newer than this count as active
+ACTIVE_CONFIRMATION_SECONDS = 2 * 60 * 60
+
+# Maximum delay adjustment (minutes, either direction) per crowd level
+CROWD_DELAY_ADJUSTMENT_RANGE = {
+    'low': 0,
+    'medium': 2,
+    'high': 5,
+    'very_high': 8
+}
+
+# Crowd snapshots are reused for this long unless the train's data changes
+SNAPSHOT_TTL_SECONDS = 2.0
+
+# Buffered log events are flushed on a background thread at this interval,
+# or immediately once this many are pending
+FLUSH_INTERVAL_SECONDS = 0.25
+FLUSH_MAX_PENDING = 256
+
+def _crowd_level_for(active_count: int) -> str:
+    """Map an active confirmation count to a crowd level"""
+    if active_count == 0:
+        return 'low'
+    elif active_count <= 5:
+        return 'medium'
+    elif active_count <= 15:
+        return 'high'
+    else:
+        return 'very_high'
+
+def _confidence_for(active_count: int) -> str:
+    """Map an active confirmation count to a confidence level"""
+    if active_count == 0:
+        return 'none'
+    elif active_count <= 3:
+        return 'low'
+    elif active_count <= 10:
+        return 'medium'
+    else:
+        return 'high'
+
 class CrowdValidation:
     """Manages crowd validation for train tracking accuracy"""
     
     def __init__(self, data_file: str = "crowd_validations.json"):
         self.data_file = data_file
+        self.log_file = os.path.splitext(data_file)[0] + ".jsonl"
+        self._log_fd = None
+        self._pending = []
+        self._log_lock = threading.Lock()
+        self._flush_thread = None
+        self._user_index = {}
+        self._train_epochs = {}
+        self._snapshot_cache = {}
+        self._total_confirmations = 0
+        self._active_epochs = []
+        self._state_lock = threading.RLock()
         self.validations = self._load_validations()
+        atexit.register(self.flush)
         
     def _load_validations(self) -> Dict[str, Any]:
-        """Load existing validations from file"""
+        """Load the validations snapshot and replay the event log on top of it"""
         try:
             if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+                self.validations = json_utils.load_file(self.data_file)
+            else:
+                self.validations = {}
+            
+            # Keep each train's confirmations ordered by time, with their epoch
+            # seconds in a parallel list, so the active window can be found with
+            # a binary search
+            self._train_epochs = {}
+            for train_number, train_data in self.validations.items():
+                for conf in train_data['confirmations']:
+                    # Snapshots from earlier builds stored the epoch on each record
+                    conf.pop('ts_epoch', None)
+                timed = sorted(
+                    ((self._parse_epoch(conf.get('timestamp')), conf) for conf in train_data['confirmations']),
+                    key=itemgetter(0)
+                )
+                train_data['confirmations'] = [conf for _, conf in timed]
+                self._train_epochs[train_number] = [ts_epoch for ts_epoch, _ in timed]
+            
+            self._reset_counters()
         except Exception as e:
             logger.error(f"Error loading validations: {e}")
-            return {}
+            self.validations = {}
+            self._train_epochs = {}
+            self._reset_counters()
+        
+        self._user_index = {}
+        self._snapshot_cache = {}
+        self._replay_log()
+        return self.validations
+    
+    def _reset_counters(self):
+        """Recompute the running confirmation counters from the full state"""
+        cutoff = time.time() - ACTIVE_CONFIRMATION_SECONDS
+        self._total_confirmations = sum(
+            train_data['total_confirmations'] for train_data in self.validations.values()
+        )
+        self._active_epochs = sorted(
+            ts_epoch
+            for epochs in self._train_epochs.values()
+            for ts_epoch in epochs[bisect_right(epochs, cutoff):]
+        )
     
-    def _save_validations(self):
-        """Save validations to file"""
+    def _add_active_epoch(self, ts_epoch: float):
+        """Track a confirmation time for the global active count"""
+        if ts_epoch > time.time() - ACTIVE_CONFIRMATION_SECONDS:
+            insort(self._active_epochs, ts_epoch)
+    
+    def _discard_active_epoch(self, ts_epoch: float):
+        """Stop tracking a confirmation time, if it is still tracked"""
+        epochs = self._active_epochs
+        idx = bisect_left(epochs, ts_epoch)
+        if idx < len(epochs) and epochs[idx] == ts_epoch:
+            del epochs[idx]
+    
+    def _replay_log(self):
+        """Apply events appended since the last snapshot"""
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.validations, f, indent=2, default=str)
+            if not os.path.exists(self.log_file):
+                return
+            
+            replayed = 0
+            with open(self.log_file, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        event = json_utils.loads(line)
+                    except Exception:
+                        # A torn final line from an interrupted write is skipped
+                        logger.warning("Skipping malformed validation log entry")
+                        continue
+                    
+                    if event.get('op') == 'add':
+                        self._apply_confirmation(
+                            event['train'], event['user'], event['ts'],
+                            event.get('station'), event.get('coordinates'),
+                            event.get('ts_epoch')
+                        )
+                    elif event.get('op') == 'del':
+                        self._apply_removal(event['train'], event['user'], event['ts'])
+                    replayed += 1
+            
+            if replayed:
+                logger.info(f"Replayed {replayed} validation events")
+                
+        except Exception as e:
+            logger.error(f"Error replaying validation log: {e}")
+    
+    def _save_validations(self) -> bool:
+        """Write a full snapshot of validations to file, returning True once it is in place"""
+        try:
+            temp_file = f"{self.data_file}.tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(json_utils.dumps(self.validations, indent=True))
+            os.replace(temp_file, self.data_file)
+            return True
         except Exception as e:
             logger.error(f"Error saving validations: {e}")
+            return False
     
-    def confirm_user_on_train(self, train_number: str, user_id: str, 
-                             station_name: str = None, coordinates: Dict[str, float] = None) -> Dict[str, Any]:
-        """Confirm a user is on a specific train"""
+    def _append_event(self, event: Dict[str, Any]):
+        """Queue a single validation event for the log"""
         try:
-            timestamp = datetime.now().isoformat()
-            
-            if train_number not in self.validations:
-                self.validations[train_number] = {
-                    'confirmations': [],
-                    'last_updated': timestamp,
-                    'total_confirmations': 0
-                }
+            line = json_utils.dumps(event) + b"\n"
+            with self._log_lock:
+                self._pending.append(line)
+                pending_count = len(self._pending)
             
-            # Check if user already confirmed
-            existing_confirmation = None
-            for conf in self.validations[train_number]['confirmations']:
-                if conf.get('user_id') == user_id:
-                    existing_confirmation = conf
-                    break
-            
-            if existing_confirmation:
-                # Update existing confirmation
-                existing_confirmation.update({
-                    'timestamp': timestamp,
-                    'station_name': station_name,
-                    'coordinates': coordinates
-                })
-                message = "Confirmation updated"
+            if pending_count >= FLUSH_MAX_PENDING:
+                self.flush()
             else:
-                # Add new confirmation
-                confirmation = {
-                    'user_id': user_id,
-                    'timestamp': timestamp,
-                    'station_name': station_name,
-                    'coordinates': coordinates
-                }
-                self.validations[train_number]['confirmations'].append(confirmation)
-                self.validations[train_number]['total_confirmations'] += 1
-                message = "Confirmation added"
-            
-            self.validations[train_number]['last_updated'] = timestamp
-            self._save_validations()
+                self._ensure_flush_thread()
+                
+        except Exception as e:
+            logger.error(f"Error appending validation event: {e}")
+    
+    def _ensure_flush_thread(self):
+        """Start the background log flusher on first use"""
+        if self._flush_thread is not None:
+            return
+        with self._log_lock:
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(
+                    target=self._flush_loop, name="crowd-validation-flush", daemon=True
+                )
+                self._flush_thread.start()
+    
+    def _flush_loop(self):
+        """Periodically write buffered events to the log"""
+        while True:
+            time.sleep(FLUSH_INTERVAL_SECONDS)
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered events to the log in one call, compacting when it grows large"""
+        try:
+            with self._log_lock:
+                if not self._pending:
+                    return
+                
+                data = b"".join(self._pending)
+                self._pending.clear()
+                
+                if self._log_fd is None:
+                    self._log_fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                os.write(self._log_fd, data)
+                needs_compaction = self._should_compact()
             
-            # Calculate crowd metrics
-            crowd_metrics = self._calculate_crowd_metrics(train_number)
+            # Compact outside the log lock so locks are always taken state -> log
+            if needs_compaction:
+                self._compact()
             
-            return {
-                'success': True,
-                'message': message,
-                'train_number': train_number,
+        except Exception as e:
+            logger.error(f"Error flushing validation events: {e}")
+    
+    def _should_compact(self) -> bool:
+        """Check whether the log has outgrown the snapshot"""
+        log_size = os.fstat(self._log_fd).st_size
+        snapshot_size = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+        return log_size > max(COMPACT_MIN_LOG_BYTES, COMPACT_LOG_RATIO * snapshot_size)
+    
+    def _compact(self):
+        """Fold the event log into a fresh snapshot and truncate the log"""
+        with self._state_lock, self._log_lock:
+            self._compact_locked()
+    
+    def _compact_locked(self):
+        """Compact while holding the state and log locks"""
+        try:
+            if not self._save_validations():
+                # The log is still the only durable copy of recent events, so keep it
+                logger.warning("Snapshot not saved, keeping the validation log")
+                return
+            
+            # The snapshot includes every buffered event, so they no longer need writing
+            self._pending.clear()
+            if self._log_fd is not None:
+                os.ftruncate(self._log_fd, 0)
+            elif os.path.exists(self.log_file):
+                os.truncate(self.log_file, 0)
+            logger.info("Compacted crowd validation log")
+        except Exception as e:
+            logger.error(f"Error compacting validations: {e}")
+    
+    def _apply_confirmation(self, train_number: str, user_id: str, timestamp: str,
+                            station_name: str = None, coordinates: Dict[str, float] = None,
+                            ts_epoch: float = None) -> bool:
+        """Add or update a confirmation in memory, returning True if it is new"""
+        if train_number not in self.validations:
+            self.validations[train_number] = {
+                'confirmations': [],
+                'last_updated': timestamp,
+                'total_confirmations': 0
+            }
+            self._train_epochs[train_number] = []
+        
+        if ts_epoch is None:
+            ts_epoch = self._parse_epoch(timestamp)
+        
+        # Check if user already confirmed
+        user_index = self._get_user_index(train_number)
+        existing_confirmation = user_index.get(user_id)
+        
+        if existing_confirmation:
+            # Update existing confirmation and move it to its new time position
+            self._discard_active_epoch(self._remove_confirmation(train_number, existing_confirmation))
+            existing_confirmation.update({
+                'timestamp': timestamp,
+                'station_name': station_name,
+                'coordinates': coordinates
+            })
+            self._insert_confirmation(train_number, existing_confirmation, ts_epoch)
+            self._add_active_epoch(ts_epoch)
+            is_new = False
+        else:
+            # Add new confirmation
+            confirmation = {
                 'user_id': user_id,
                 'timestamp': timestamp,
-                'crowd_metrics': crowd_metrics
+                'station_name': station_name,
+                'coordinates': coordinates
             }
-            
-        except Exception as e:
-            logger.error(f"Error confirming user on train: {e}")
+            self._insert_confirmation(train_number, confirmation, ts_epoch)
+            self._add_active_epoch(ts_epoch)
+            self.validations[train_number]['total_confirmations'] += 1
+            self._total_confirmations += 1
+            user_index[user_id] = confirmation
+            is_new = True
+        
+        self.validations[train_number]['last_updated'] = timestamp
+        self._invalidate_snapshot(train_number)
+        return is_new
+    
+    def _apply_removal(self, train_number: str, user_id: str, timestamp: str) -> bool:
+        """Remove a confirmation in memory, returning True if one was removed"""
+        if train_number not in self.validations:
+            return False
+        
+        conf = self._get_user_index(train_number).pop(user_id, None)
+        if conf is None:
+            return False
+        
+        self._discard_active_epoch(self._remove_confirmation(train_number, conf))
+        self.validations[train_number]['total_confirmations'] -= 1
+        self._total_confirmations -= 1
+        self.validations[train_number]['last_updated'] = timestamp
+        self._invalidate_snapshot(train_number)
+        return True
+    
+    def _parse_epoch(self, timestamp: Optional[str]) -> float:
+        """Convert an ISO timestamp to epoch seconds, sorting unreadable ones first as -inf"""
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            return float('-inf')
+    
+    def _insert_confirmation(self, train_number: str, conf: Dict[str, Any], ts_epoch: float):
+        """Insert a confirmation and its epoch, keeping the train's lists ordered by time"""
+        epochs = self._train_epochs[train_number]
+        idx = bisect_right(epochs, ts_epoch)
+        epochs.insert(idx, ts_epoch)
+        self.validations[train_number]['confirmations'].insert(idx, conf)
+    
+    def _remove_confirmation(self, train_number: str, conf: Dict[str, Any]) -> float:
+        """Remove a confirmation from a train's lists, returning its epoch"""
+        confirmations = self.validations[train_number]['confirmations']
+        idx = next(i for i, c in enumerate(confirmations) if c is conf)
+        del confirmations[idx]
+        return self._train_epochs[train_number].pop(idx)
+    
+    def _get_user_index(self, train_number: str) -> Dict[str, Dict[str, Any]]:
+        """Get the user_id -> confirmation index for a train, building it on first use"""
+        user_index = self._user_index.get(train_number)
+        if user_index is None:
+            user_index = {}
+            for conf in self.validations[train_number]['confirmations']:
+                # Keep the first record per user, as the original linear scan did
+                user_index.setdefault(conf.get('user_id'), conf)
+            self._user_index[train_number] = user_index
+        return user_index
+    
+    def confirm_user_on_train(self, train_number: str, user_id: str, 
+                             station_name: str = None, coordinates: Dict[str, float] = None) -> Dict[str, Any]:
+        """Confirm a user is on a specific train"""
+        if not train_number or not user_id:
             return {
                 'success': False,
-                'error': str(e)
+                'error': 'Train number and user ID are required'
             }
+        
+        ts_epoch = time.time()
+        timestamp = datetime.fromtimestamp(ts_epoch).isoformat()
+        
+        with self._state_lock:
+            is_new = self._apply_confirmation(
+                train_number, user_id, timestamp, station_name, coordinates, ts_epoch
+            )
+            message = "Confirmation added" if is_new else "Confirmation updated"
+            
+            self._append_event({
+                'op': 'add',
+                'train': train_number,
+                'user': user_id,
+                'ts': timestamp,
+                'ts_epoch': ts_epoch,
+                'station': station_name,
+                'coordinates': coordinates
+            })
+            
+            # Calculate crowd metrics
+            crowd_metrics = self._calculate_crowd_metrics(train_number)
+        
+        return {
+            'success': True,
+            'message': message,
+            'train_number': train_number,
+            'user_id': user_id,
+            'timestamp': timestamp,
+            'crowd_metrics': crowd_metrics
+        }
     
     def remove_user_confirmation(self, train_number: str, user_id: str) -> Dict[str, Any]:
         """Remove a user's confirmation"""
         try:
-            if train_number not in self.validations:
-                return {
-                    'success': False,
-                    'error': 'No validations found for this train'
-                }
-            
-            # Find and remove confirmation
-            confirmations = self.validations[train_number]['confirmations']
-            for i, conf in enumerate(confirmations):
-                if conf.get('user_id') == user_id:
-                    del confirmations[i]
-                    self.validations[train_number]['total_confirmations'] -= 1
-                    self.validations[train_number]['last_updated'] = datetime.now().isoformat()
-                    self._save_validations()
+            with self._state_lock:
+                if train_number not in self.validations:
+                    return {
+                        'success': False,
+                        'error': 'No validations found for this train'
+                    }
+                
+                timestamp = datetime.now().isoformat()
+                if self._apply_removal(train_number, user_id, timestamp):
+                    self._append_event({
+                        'op': 'del',
+                        'train': train_number,
+                        'user': user_id,
+                        'ts': timestamp
+                    })
                     
                     return {
                         'success': True,
@@ -140,142 +451,131 @@ class CrowdValidation:
     
     def get_train_crowd_data(self, train_number: str) -> Dict[str, Any]:
         """Get crowd data for a specific train"""
-        try:
-            if train_number not in self.validations:
-                return {
-                    'train_number': train_number,
-                    'total_confirmations': 0,
-                    'active_confirmations': 0,
-                    'crowd_level': 'low',
-                    'last_updated': None,
-                    'confirmations': []
-                }
-            
-            train_data = self.validations[train_number]
-            active_confirmations = self._get_active_confirmations(train_data['confirmations'])
-            
-            crowd_level = self._determine_crowd_level(len(active_confirmations))
-            
-            return {
-                'train_number': train_number,
-                'total_confirmations': train_data['total_confirmations'],
-                'active_confirmations': len(active_confirmations),
-                'crowd_level': crowd_level,
-                'last_updated': train_data['last_updated'],
-                'confirmations': active_confirmations
-            }
-            
-        except Exception as e:
-            logger.error(f"Error getting train crowd data: {e}")
+        snapshot = self._compute_crowd_snapshot(train_number)
+        
+        return {
+            'train_number': train_number,
+            'total_confirmations': snapshot['total_confirmations'],
+            'active_confirmations': snapshot['active_confirmations'],
+            'crowd_level': snapshot['crowd_level'],
+            'last_updated': snapshot['last_updated'],
+            'confirmations': snapshot['confirmations']
+        }
+    
+    def _invalidate_snapshot(self, train_number: str):
+        """Drop the cached crowd snapshot for a train"""
+        with self._state_lock:
+            self._snapshot_cache.pop(train_number, None)
+    
+    def _compute_crowd_snapshot(self, train_number: str) -> Dict[str, Any]:
+        """Get a train's crowd snapshot, reusing a recent one when available"""
+        with self._state_lock:
+            cached = self._snapshot_cache.get(train_number)
+            if cached is not None and time.time() - cached['computed_at'] < SNAPSHOT_TTL_SECONDS:
+                return cached
+            
+            snapshot = self._build_crowd_snapshot(train_number)
+            self._snapshot_cache[train_number] = snapshot
+            return snapshot
+    
+    def _build_crowd_snapshot(self, train_number: str) -> Dict[str, Any]:
+        """Summarize a train's active confirmations in a single pass"""
+        now = time.time()
+        train_data = self.validations.get(train_number)
+        if train_data is None:
             return {
-                'error': str(e)
+                'confirmations': [],
+                'active_confirmations': 0,
+                'total_confirmations': 0,
+                'last_updated': None,
+                'crowd_level': 'low',
+                'confidence': 'none',
+                'sum_epoch': 0.0,
+                'max_epoch': None,
+                'computed_at': now
             }
-    
-    def _get_active_confirmations(self, confirmations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Get confirmations that are still active (within last 2 hours)"""
-        try:
-            active = []
-            cutoff_time = datetime.now() - timedelta(hours=2)
-            
-            for conf in confirmations:
-                try:
-                    conf_time = datetime.fromisoformat(conf['timestamp'])
-                    if conf_time > cutoff_time:
-                        active.append(conf)
-                except:
-                    continue
-            
-            return active
-            
-        except Exception as e:
-            logger.warning(f"Error getting active confirmations: {e}")
-            return []
+        
+        # Confirmations within the last 2 hours are active; the list is
+        # time-ordered so they form its tail
+        epochs = self._train_epochs[train_number]
+        start = bisect_right(epochs, now - ACTIVE_CONFIRMATION_SECONDS)
+        active = train_data['confirmations'][start:]
+        active_epochs = epochs[start:]
+        
+        sum_epoch = sum(active_epochs)
+        max_epoch = active_epochs[-1] if active_epochs else None
+        
+        active_count = len(active)
+        return {
+            'confirmations': active,
+            'active_confirmations': active_count,
+            'total_confirmations': train_data['total_confirmations'],
+            'last_updated': train_data['last_updated'],
+            'crowd_level': _crowd_level_for(active_count),
+            'confidence': _confidence_for(active_count),
+            'sum_epoch': sum_epoch,
+            'max_epoch': max_epoch,
+            'computed_at': now
+        }
     
     def _determine_crowd_level(self, active_count: int) -> str:
         """Determine crowd level based on active confirmations"""
-        if active_count == 0:
-            return 'low'
-        elif active_count <= 5:
-            return 'medium'
-        elif active_count <= 15:
-            return 'high'
-        else:
-            return 'very_high'
+        return _crowd_level_for(active_count)
+    
+    def _determine_confidence(self, active_count: int) -> str:
+        """Determine confidence level based on number of active confirmations"""
+        return _confidence_for(active_count)
     
     def _calculate_crowd_metrics(self, train_number: str) -> Dict[str, Any]:
         """Calculate various crowd metrics"""
-        try:
-            crowd_data = self.get_train_crowd_data(train_number)
-            
-            # Calculate confidence level based on number of confirmations
-            active_count = crowd_data['active_confirmations']
-            if active_count == 0:
-                confidence = 'none'
-            elif active_count <= 3:
-                confidence = 'low'
-            elif active_count <= 10:
-                confidence = 'medium'
-            else:
-                confidence = 'high'
-            
-            # Calculate average time since confirmations
-            if crowd_data['confirmations']:
-                timestamps = [datetime.fromisoformat(conf['timestamp']) for conf in crowd_data['confirmations']]
-                avg_time_diff = sum([(datetime.now() - ts).total_seconds() for ts in timestamps]) / len(timestamps)
-                avg_minutes_ago = int(avg_time_diff / 60)
-            else:
-                avg_minutes_ago = 0
-            
-            return {
-                'crowd_level': crowd_data['crowd_level'],
-                'confidence': confidence,
-                'active_users': active_count,
-                'average_time_since_confirmation': f"{avg_minutes_ago} minutes ago",
-                'data_freshness': 'high' if avg_minutes_ago < 30 else 'medium' if avg_minutes_ago < 60 else 'low'
-            }
-            
-        except Exception as e:
-            logger.error(f"Error calculating crowd metrics: {e}")
-            return {
-                'crowd_level': 'unknown',
-                'confidence': 'none',
-                'active_users': 0,
-                'average_time_since_confirmation': 'unknown',
-                'data_freshness': 'unknown'
-            }
+        snapshot = self._compute_crowd_snapshot(train_number)
+        active_count = snapshot['active_confirmations']
+        
+        # Calculate average time since confirmations
+        if active_count:
+            avg_time_diff = snapshot['computed_at'] - snapshot['sum_epoch'] / active_count
+            avg_minutes_ago = int(avg_time_diff / 60)
+        else:
+            avg_minutes_ago = 0
+        
+        return {
+            'crowd_level': snapshot['crowd_level'],
+            'confidence': snapshot['confidence'],
+            'active_users': active_count,
+            'average_time_since_confirmation': f"{avg_minutes_ago} minutes ago",
+            'data_freshness': 'high' if avg_minutes_ago < 30 else 'medium' if avg_minutes_ago < 60 else 'low'
+        }
     
     def adjust_train_status_with_crowd_data(self, train_number: str, 
                                           base_status: Dict[str, Any]) -> Dict[str, Any]:
         """Adjust train status based on crowd validation data"""
         try:
-            crowd_data = self.get_train_crowd_data(train_number)
+            crowd_data = self._compute_crowd_snapshot(train_number)
             
-            if 'error' in crowd_data:
+            # Without enough crowd data the base status is returned untouched
+            if crowd_data['confidence'] not in ('medium', 'high'):
                 return base_status
             
-            # Adjust delay based on crowd data
-            adjusted_status = base_status.copy()
+            # Use crowd data to refine status
+            adjusted_status = {**base_status}
+            crowd_delay_adjustment = self._calculate_crowd_delay_adjustment(crowd_data)
             
-            if crowd_data['confidence'] in ['medium', 'high']:
-                # Use crowd data to refine status
-                crowd_delay_adjustment = self._calculate_crowd_delay_adjustment(crowd_data)
-                
-                if 'delay_minutes' in adjusted_status:
-                    adjusted_status['delay_minutes'] = max(0, 
-                        adjusted_status['delay_minutes'] + crowd_delay_adjustment)
-                
-                # Add crowd validation info
-                adjusted_status['crowd_validation'] = {
-                    'confidence': crowd_data['confidence'],
-                    'active_users': crowd_data['active_confirmations'],
-                    'crowd_level': crowd_data['crowd_level'],
-                    'last_updated': crowd_data['last_updated']
-                }
-                
-                # Adjust ETA if we have high confidence crowd data
-                if crowd_data['confidence'] == 'high' and crowd_data['active_confirmations'] > 5:
-                    adjusted_status['eta_adjusted_by_crowd'] = True
-                    adjusted_status['crowd_eta_confidence'] = 'high'
+            if 'delay_minutes' in adjusted_status:
+                adjusted_status['delay_minutes'] = max(0, 
+                    adjusted_status['delay_minutes'] + crowd_delay_adjustment)
+            
+            # Add crowd validation info
+            adjusted_status['crowd_validation'] = {
+                'confidence': crowd_data['confidence'],
+                'active_users': crowd_data['active_confirmations'],
+                'crowd_level': crowd_data['crowd_level'],
+                'last_updated': crowd_data['last_updated']
+            }
+            
+            # Adjust ETA if we have high confidence crowd data
+            if crowd_data['confidence'] == 'high' and crowd_data['active_confirmations'] > 5:
+                adjusted_status['eta_adjusted_by_crowd'] = True
+                adjusted_status['crowd_eta_confidence'] = 'high'
             
             return adjusted_status
             
@@ -285,45 +585,40 @@ class CrowdValidation:
     
     def _calculate_crowd_delay_adjustment(self, crowd_data: Dict[str, Any]) -> int:
         """Calculate delay adjustment based on crowd data"""
-        try:
-            # Simple heuristic: more users = more accurate delay
-            active_users = crowd_data['active_confirmations']
-            crowd_level = crowd_data['crowd_level']
-            
-            # Base adjustment
-            if crowd_level == 'low':
-                adjustment = 0
-            elif crowd_level == 'medium':
-                adjustment = random.randint(-2, 2)  # Small adjustment
-            elif crowd_level == 'high':
-                adjustment = random.randint(-5, 5)  # Medium adjustment
-            else:  # very_high
-                adjustment = random.randint(-8, 8)  # Larger adjustment
-            
-            # Scale by number of users
-            if active_users > 10:
-                adjustment = int(adjustment * 1.5)
-            elif active_users > 20:
-                adjustment = int(adjustment * 2.0)
-            
-            return adjustment
-            
-        except Exception as e:
-            logger.warning(f"Error calculating crowd delay adjustment: {e}")
-            return 0
+        # Simple heuristic: more users = more accurate delay
+        active_users = crowd_data['active_confirmations']
+        max_adjustment = CROWD_DELAY_ADJUSTMENT_RANGE.get(crowd_data['crowd_level'], 8)
+        
+        # Uniform draw over [-max_adjustment, max_adjustment] from a single random()
+        adjustment = int(random.random() * (2 * max_adjustment + 1)) - max_adjustment
+        
+        # Scale by number of users: x1.5 above 10 users
+        scale = 1.0 + 0.5 * (active_users > 10)
+        return int(adjustment * scale)
+    
+    def counters(self) -> Tuple[int, int, int]:
+        """Get (trains with validations, total confirmations, active confirmations) in O(1)"""
+        with self._state_lock:
+            # Drop confirmation times that have aged out of the active window
+            epochs = self._active_epochs
+            expired = bisect_right(epochs, time.time() - ACTIVE_CONFIRMATION_SECONDS)
+            if expired:
+                del epochs[:expired]
+            return len(self.validations), self._total_confirmations, len(epochs)
     
     def get_all_train_validations(self) -> Dict[str, Any]:
         """Get validation data for all trains"""
         try:
             summary = {}
-            for train_number, data in self.validations.items():
-                crowd_data = self.get_train_crowd_data(train_number)
-                summary[train_number] = {
-                    'total_confirmations': data['total_confirmations'],
-                    'active_confirmations': crowd_data['active_confirmations'],
-                    'crowd_level': crowd_data['crowd_level'],
-                    'last_updated': data['last_updated']
-                }
+            with self._state_lock:
+                for train_number, data in self.validations.items():
+                    crowd_data = self._compute_crowd_snapshot(train_number)
+                    summary[train_number] = {
+                        'total_confirmations': data['total_confirmations'],
+                        'active_confirmations': crowd_data['active_confirmations'],
+                        'crowd_level': crowd_data['crowd_level'],
+                        'last_updated': data['last_updated']
+                    }
             
             return summary
             
@@ -334,33 +629,36 @@ class CrowdValidation:
     def cleanup_old_validations(self, max_age_hours: int = 24):
         """Clean up old validations to prevent data bloat"""
         try:
-            cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-            cleaned_count = 0
-            
-            for train_number in list(self.validations.keys()):
-                train_data = self.validations[train_number]
-                
-                # Remove old confirmations
-                old_confirmations = []
-                for conf in train_data['confirmations']:
-                    try:
-                        conf_time = datetime.fromisoformat(conf['timestamp'])
-                        if conf_time > cutoff_time:
-                            old_confirmations.append(conf)
-                    except:
-                        continue
+            with self._state_lock:
+                cutoff = time.time() - max_age_hours * 3600
+                cleaned_count = 0
                 
-                # Update train data
-                self.validations[train_number]['confirmations'] = old_confirmations
-                self.validations[train_number]['total_confirmations'] = len(old_confirmations)
+                for train_number in list(self.validations.keys()):
+                    train_data = self.validations[train_number]
+                    
+                    # Remove old confirmations; the lists are time-ordered, so the
+                    # recent ones form their tail
+                    epochs = self._train_epochs[train_number]
+                    start = bisect_right(epochs, cutoff)
+                    old_confirmations = train_data['confirmations'][start:]
+                    
+                    # Update train data
+                    self.validations[train_number]['confirmations'] = old_confirmations
+                    self.validations[train_number]['total_confirmations'] = len(old_confirmations)
+                    self._train_epochs[train_number] = epochs[start:]
+                    self._user_index.pop(train_number, None)
+                    
+                    # Remove train if no confirmations left
+                    if len(old_confirmations) == 0:
+                        del self.validations[train_number]
+                        del self._train_epochs[train_number]
+                        cleaned_count += 1
                 
-                # Remove train if no confirmations left
-                if len(old_confirmations) == 0:
-                    del self.validations[train_number]
-                    cleaned_count += 1
+                self._snapshot_cache.clear()
+                self._reset_counters()
             
             if cleaned_count > 0:
-                self._save_validations()
+                self._compact()
                 logger.info(f"Cleaned up {cleaned_count} trains with old validations")
             
             return cleaned_count
@@ -369,6 +667,9 @@ class CrowdValidation:
             logger.error(f"Error cleaning up old validations: {e}")
             return 0
 
+# Global instance
+crowd_validation = CrowdValidation(Config.CROWD_VALIDATIONS_FILE)
+
 def get_crowd_validation() -> CrowdValidation:
-    """Get crowd validation instance"""
-    return CrowdValidation()
+    """Get the global crowd validation instance"""
+    return crowd_validation
@@ -4,28 +4,60 @@ Data Loader Module for TrainJatri Backend
 Handles loading and caching of all JSON data files
 """
 
-import json
 import os
+import sys
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-import glob
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+
+import json_utils
+from config import Config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# One train's stop at a station, with fields named as the API reports them
+StationStop = namedtuple(
+    'StationStop',
+    'train_number train_name arrival_time departure_time halt_duration operating_days'
+)
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One complete load of the data files, replaced as a whole on reload"""
+    stations: Dict[str, List[float]] = field(default_factory=dict)
+    stations_json: bytes = b'{}'
+    segments: Dict[str, Any] = field(default_factory=dict)
+    segments_mtime: Optional[int] = None
+    schedules: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    schedule_json: Dict[str, bytes] = field(default_factory=dict)  # Filled lazily per train
+    station_to_trains: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    od_index: Dict[Tuple[str, str], Tuple[str, ...]] = field(default_factory=dict)
+    station_stops: Dict[str, Tuple[StationStop, ...]] = field(default_factory=dict)
+    search_index: List[Tuple[str, str, str]] = field(default_factory=list)
+    route_mappings: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    loaded_at: Optional[datetime] = None
+    version: int = 0
+
 class DataLoader:
     """Centralized data loader for all TrainJatri data files"""
     
     def __init__(self, data_dir: str = "."):
         self.data_dir = data_dir
-        self._stations = None
-        self._segments = None
-        self._schedules = {}
-        self._route_mappings = {}
-        self._last_loaded = None
+        # Readers take self._snapshot with a single attribute read; reloads build
+        # a new Snapshot and swap it in, so no request sees a half-loaded state
+        self._snapshot = Snapshot()
+        self._load_lock = threading.Lock()
+        self._last_checked = None
+        self._data_stamp = None
         self._cache_duration = 300  # 5 minutes cache
+        self._schedules_cache_file = os.path.join(data_dir, "schedules.cache.pkl")
         
     def load_all_data(self, force_reload: bool = False) -> Dict[str, Any]:
         """Load all data files and return status"""
@@ -36,19 +68,39 @@ class DataLoader:
             
             logger.info("Loading all data files...")
             
-            # Load stations
-            self._stations = self._load_stations()
-            
-            # Load segments
-            self._segments = self._load_segments()
-            
-            # Load schedules
-            self._schedules = self._load_schedules()
-            
-            # Load route mappings
-            self._route_mappings = self._load_route_mappings()
-            
-            self._last_loaded = datetime.now()
+            with self._load_lock:
+                previous = self._snapshot
+                
+                # Load stations
+                stations = self._load_stations()
+                station_pool = {name: sys.intern(name) for name in stations}
+                
+                # Load segments, reusing the previous parse when the file is unchanged
+                segments, segments_mtime = self._load_segments(previous)
+                
+                # Load schedules
+                schedules = self._load_schedules()
+                self._intern_station_names(schedules, station_pool)
+                
+                station_to_trains = self._build_station_index(schedules)
+                
+                self._snapshot = Snapshot(
+                    stations=stations,
+                    stations_json=json_utils.dumps(stations),
+                    segments=segments,
+                    segments_mtime=segments_mtime,
+                    schedules=schedules,
+                    # Index schedules by station for fast route searches
+                    station_to_trains=station_to_trains,
+                    station_stops=self._build_station_stops(schedules, station_to_trains),
+                    od_index=self._build_od_index(schedules),
+                    search_index=self._build_search_index(schedules),
+                    route_mappings=self._load_route_mappings(),
+                    loaded_at=datetime.now(),
+                    version=previous.version + 1
+                )
+                self._last_checked = self._snapshot.loaded_at
+                self._data_stamp = self._get_data_stamp()
             
             status = self._get_cache_status()
             logger.info(f"Data loaded successfully: {status}")
@@ -58,22 +110,75 @@ class DataLoader:
             logger.error(f"Error loading data: {e}")
             return {"error": str(e)}
     
+    @property
+    def version(self) -> int:
+        """Version of the current snapshot, bumped on every reload"""
+        return self._snapshot.version
+    
+    def current(self) -> Snapshot:
+        """Get the latest complete data snapshot, loading it on first use"""
+        snapshot = self._snapshot
+        if snapshot.loaded_at is None:
+            self.load_all_data()
+            snapshot = self._snapshot
+        return snapshot
+    
     def _is_cache_valid(self) -> bool:
         """Check if cached data is still valid"""
-        if not self._last_loaded:
+        if not self._last_checked:
             return False
         
-        elapsed = (datetime.now() - self._last_loaded).total_seconds()
+        elapsed = (datetime.now() - self._last_checked).total_seconds()
         return elapsed < self._cache_duration
     
+    def _get_data_stamp(self) -> Tuple[Tuple[str, int], ...]:
+        """Collect modification times of every data file the loader reads"""
+        stamp = []
+        
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if (name in ("stations.json", "Bangladesh_500m_segments.json")
+                        or ('train_route_mapping' in name and name.endswith('.json'))):
+                    stamp.append((name, entry.stat().st_mtime_ns))
+        
+        schedules_dir = os.path.join(self.data_dir, "schedules")
+        if os.path.isdir(schedules_dir):
+            with os.scandir(schedules_dir) as entries:
+                stamp.extend(
+                    (f"schedules/{entry.name}", entry.stat().st_mtime_ns)
+                    for entry in entries if entry.name.endswith('.json')
+                )
+        
+        return tuple(sorted(stamp))
+    
+    def _load_if_dirty(self):
+        """Load data on first use, and reload after expiry only if files changed on disk"""
+        if self._snapshot.loaded_at is None:
+            self.load_all_data()
+        elif not self._is_cache_valid():
+            if self._get_data_stamp() == self._data_stamp:
+                self._last_checked = datetime.now()
+            else:
+                self.load_all_data(force_reload=True)
+    
+    def status_snapshot(self) -> Dict[str, Any]:
+        """Get data status without re-parsing files that have not changed"""
+        try:
+            self._load_if_dirty()
+        except Exception as e:
+            logger.error(f"Error checking data files: {e}")
+        return self._get_cache_status()
+    
     def _get_cache_status(self) -> Dict[str, Any]:
         """Get status of loaded data"""
+        snapshot = self._snapshot
         return {
-            "stations_count": len(self._stations) if self._stations else 0,
-            "segments_count": len(self._segments) if self._segments else 0,
-            "schedules_count": len(self._schedules),
-            "route_mappings_count": len(self._route_mappings),
-            "last_loaded": self._last_loaded.isoformat() if self._last_loaded else None,
+            "stations_count": len(snapshot.stations),
+            "segments_count": len(snapshot.segments),
+            "schedules_count": len(snapshot.schedules),
+            "route_mappings_count": len(snapshot.route_mappings),
+            "last_loaded": snapshot.loaded_at.isoformat() if snapshot.loaded_at else None,
             "cache_valid": self._is_cache_valid()
         }
     
@@ -85,8 +190,7 @@ class DataLoader:
                 logger.warning("stations.json not found")
                 return {}
             
-            with open(stations_file, 'r', encoding='utf-8') as f:
-                stations = json.load(f)
+            stations = json_utils.load_file(stations_file)
             
             logger.info(f"Loaded {len(stations)} stations")
             return stations
@@ -95,23 +199,49 @@ class DataLoader:
             logger.error(f"Error loading stations: {e}")
             return {}
     
-    def _load_segments(self) -> Dict[str, Any]:
-        """Load Bangladesh_500m_segments.json file"""
+    def _load_segments(self, previous: Snapshot) -> Tuple[Dict[str, Any], Optional[int]]:
+        """Load Bangladesh_500m_segments.json file, returning the segments and the file's mtime"""
         try:
             segments_file = os.path.join(self.data_dir, "Bangladesh_500m_segments.json")
             if not os.path.exists(segments_file):
                 logger.warning("Bangladesh_500m_segments.json not found")
-                return {}
+                return {}, None
             
-            with open(segments_file, 'r', encoding='utf-8') as f:
-                segments = json.load(f)
+            # The segments file is large and rarely changes, so keep the parsed
+            # copy across reloads until its modification time moves
+            mtime = os.stat(segments_file).st_mtime_ns
+            if previous.segments and mtime == previous.segments_mtime:
+                logger.info("Segments unchanged, reusing parsed data")
+                return previous.segments, mtime
             
-            logger.info(f"Loaded {len(segments)} segments")
-            return segments
+            # Stream segment-by-segment so the raw file and the parsed tree
+            # are never held in memory at the same time
+            segments = {'segments': dict(json_utils.iter_items(segments_file, 'segments'))}
+            
+            logger.info(f"Loaded {len(segments['segments'])} segments")
+            return segments, mtime
             
         except Exception as e:
             logger.error(f"Error loading segments: {e}")
-            return {}
+            return {}, None
+    
+    def _load_json_files(self, paths: List[str]) -> List[Tuple[str, Any]]:
+        """Parse JSON files concurrently, returning (path, data) for each readable file"""
+        if not paths:
+            return []
+        
+        def load_one(path: str) -> Optional[Tuple[str, Any]]:
+            try:
+                return path, json_utils.load_file(path)
+            except Exception as e:
+                logger.warning(f"Error loading {path}: {e}")
+                return None
+        
+        max_workers = min(32, (os.cpu_count() or 1) * 4, len(paths))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(load_one, paths))
+        
+        return [result for result in results if result is not None]
     
     def _load_schedules(self) -> Dict[str, Dict[str, Any]]:
         """Load all schedule files from schedules/ directory"""
@@ -122,21 +252,25 @@ class DataLoader:
                 return {}
             
             schedules = {}
-            schedule_files = glob.glob(os.path.join(schedules_dir, "*.json"))
+            with os.scandir(schedules_dir) as entries:
+                schedule_files = [
+                    entry.path for entry in entries
+                    if entry.name.endswith('.json') and entry.is_file()
+                ]
+            
+            signature = self._get_schedules_signature(schedules_dir, schedule_files)
+            cached = self._read_schedules_cache(signature)
+            if cached is not None:
+                logger.info(f"Loaded {len(cached)} schedules from cache")
+                return cached
             
-            for schedule_file in schedule_files:
-                try:
-                    with open(schedule_file, 'r', encoding='utf-8') as f:
-                        schedule_data = json.load(f)
-                    
-                    # Extract train number from filename
-                    filename = os.path.basename(schedule_file)
-                    train_key = filename.replace('.json', '')
-                    schedules[train_key] = schedule_data
-                    
-                except Exception as e:
-                    logger.warning(f"Error loading {schedule_file}: {e}")
-                    continue
+            for schedule_file, schedule_data in self._load_json_files(schedule_files):
+                # Extract train number from filename
+                filename = os.path.basename(schedule_file)
+                train_key = filename.replace('.json', '')
+                schedules[train_key] = schedule_data
+            
+            self._write_schedules_cache(signature, schedules)
             
             logger.info(f"Loaded {len(schedules)} schedules")
             return schedules
@@ -145,24 +279,127 @@ class DataLoader:
             logger.error(f"Error loading schedules: {e}")
             return {}
     
+    def _get_schedules_signature(self, schedules_dir: str, schedule_files: List[str]) -> Tuple[int, int, int]:
+        """Build a stamp that changes whenever a schedule file is added, removed or modified"""
+        latest_mtime = max((os.stat(path).st_mtime_ns for path in schedule_files), default=0)
+        return (os.stat(schedules_dir).st_mtime_ns, len(schedule_files), latest_mtime)
+    
+    def _read_schedules_cache(self, signature: Tuple[int, int, int]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return cached schedules if the cache matches the current signature"""
+        try:
+            if not os.path.exists(self._schedules_cache_file):
+                return None
+            
+            with open(self._schedules_cache_file, 'rb') as f:
+                cached_signature, schedules = pickle.load(f)
+            
+            if cached_signature != signature:
+                return None
+            return schedules
+            
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable schedules cache: {e}")
+            return None
+    
+    def _write_schedules_cache(self, signature: Tuple[int, int, int], schedules: Dict[str, Dict[str, Any]]):
+        """Persist parsed schedules so the next cold start can skip parsing"""
+        try:
+            temp_file = f"{self._schedules_cache_file}.tmp"
+            with open(temp_file, 'wb') as f:
+                pickle.dump((signature, schedules), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self._schedules_cache_file)
+            
+        except Exception as e:
+            logger.warning(f"Error writing schedules cache: {e}")
+    
+    def _intern_station_names(self, schedules: Dict[str, Dict[str, Any]], pool: Dict[str, str]):
+        """Share one string object per station name across all schedule routes"""
+        for schedule in schedules.values():
+            for route in schedule.get('data', {}).get('routes', []):
+                city = route.get('city')
+                if isinstance(city, str):
+                    interned = pool.get(city)
+                    if interned is None:
+                        interned = pool[city] = sys.intern(city)
+                    route['city'] = interned
+    
+    def _build_station_index(self, schedules: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+        """Map each station to the trains stopping there and the stop's position in the route"""
+        station_index = {}
+        
+        for train_key, schedule in schedules.items():
+            routes = schedule.get('data', {}).get('routes', [])
+            for stop_idx, route in enumerate(routes):
+                city = route.get('city')
+                if city is not None:
+                    # Keep the first stop, matching list.index() semantics
+                    station_index.setdefault(city, {}).setdefault(train_key, stop_idx)
+        
+        return station_index
+    
+    def _build_station_stops(self, schedules: Dict[str, Dict[str, Any]],
+                             station_index: Dict[str, Dict[str, int]]) -> Dict[str, Tuple[StationStop, ...]]:
+        """Flatten each station's stops into compact records for the station timetable"""
+        station_stops = {}
+        
+        for station_name, trains in station_index.items():
+            stops = []
+            for train_key, stop_idx in trains.items():
+                data = schedules[train_key].get('data', {})
+                stop = data['routes'][stop_idx]
+                stops.append(StationStop(
+                    train_key,
+                    data.get('train_name', 'Unknown'),
+                    stop.get('arrival_time'),
+                    stop.get('departure_time'),
+                    stop.get('halt', '---'),
+                    data.get('days', [])
+                ))
+            station_stops[station_name] = tuple(stops)
+        
+        return station_stops
+    
+    def _build_od_index(self, schedules: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], Tuple[str, ...]]:
+        """Map every ordered (from, to) station pair to the trains that run it"""
+        od_lists = {}
+        
+        for train_key, schedule in schedules.items():
+            # Use each station's first stop, matching the station index
+            cities = list(dict.fromkeys(
+                route['city'] for route in schedule.get('data', {}).get('routes', [])
+                if route.get('city') is not None
+            ))
+            for i, from_city in enumerate(cities):
+                for to_city in cities[i + 1:]:
+                    od_lists.setdefault((from_city, to_city), []).append(train_key)
+        
+        return {pair: tuple(train_keys) for pair, train_keys in od_lists.items()}
+    
+    def _build_search_index(self, schedules: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str, str]]:
+        """Precompute lowercased train keys and names for number/name search"""
+        search_index = []
+        
+        for train_key, schedule in schedules.items():
+            train_name = schedule.get('data', {}).get('train_name') or ''
+            search_index.append((train_key, train_key.lower(), str(train_name).lower()))
+        
+        return search_index
+    
     def _load_route_mappings(self) -> Dict[str, Dict[str, Any]]:
         """Load all train route mapping files"""
         try:
             route_mappings = {}
             
             # Look for route mapping files
-            mapping_files = glob.glob(os.path.join(self.data_dir, "*train_route_mapping*.json"))
+            with os.scandir(self.data_dir) as entries:
+                mapping_files = [
+                    entry.path for entry in entries
+                    if 'train_route_mapping' in entry.name and entry.name.endswith('.json')
+                    and entry.is_file()
+                ]
             
-            for mapping_file in mapping_files:
-                try:
-                    with open(mapping_file, 'r', encoding='utf-8') as f:
-                        mapping_data = json.load(f)
-                    
-                    route_mappings.update(mapping_data)
-                    
-                except Exception as e:
-                    logger.warning(f"Error loading {mapping_file}: {e}")
-                    continue
+            for _, mapping_data in self._load_json_files(mapping_files):
+                route_mappings.update(mapping_data)
             
             logger.info(f"Loaded {len(route_mappings)} route mappings")
             return route_mappings
@@ -173,33 +410,42 @@ class DataLoader:
     
     def get_stations(self) -> Dict[str, List[float]]:
         """Get loaded stations data"""
-        if not self._stations:
-            self.load_all_data()
-        return self._stations or {}
+        return self.current().stations
+    
+    def get_stations_json(self) -> bytes:
+        """Get the stations data as encoded JSON, serialized once per load"""
+        return self.current().stations_json
     
     def get_segments(self) -> Dict[str, Any]:
         """Get loaded segments data"""
-        if not self._segments:
-            self.load_all_data()
-        return self._segments or {}
+        return self.current().segments
     
     def get_schedules(self) -> Dict[str, Dict[str, Any]]:
         """Get loaded schedules data"""
-        if not self._schedules:
-            self.load_all_data()
-        return self._schedules or {}
+        return self.current().schedules
     
     def get_route_mappings(self) -> Dict[str, Dict[str, Any]]:
         """Get loaded route mappings data"""
-        if not self._route_mappings:
-            self.load_all_data()
-        return self._route_mappings or {}
+        return self.current().route_mappings
     
     def get_schedule_by_train(self, train_number: str) -> Optional[Dict[str, Any]]:
         """Get schedule for a specific train"""
         schedules = self.get_schedules()
         return schedules.get(train_number)
     
+    def get_schedule_json(self, train_key: str, schedule: Optional[Dict[str, Any]] = None) -> bytes:
+        """Get a train's schedule as encoded JSON, serialized once per load"""
+        snapshot = self.current()
+        if schedule is not None and schedule is not snapshot.schedules.get(train_key):
+            # The schedule came from an older snapshot, so encode it directly
+            return json_utils.dumps(schedule)
+        
+        schedule_json = snapshot.schedule_json.get(train_key)
+        if schedule_json is None:
+            schedule_json = json_utils.dumps(snapshot.schedules[train_key])
+            snapshot.schedule_json[train_key] = schedule_json
+        return schedule_json
+    
     def get_route_mapping_by_train(self, train_number: str) -> Optional[Dict[str, Any]]:
         """Get route mapping for a specific train"""
         route_mappings = self.get_route_mappings()
@@ -207,66 +453,43 @@ class DataLoader:
     
     def search_trains_by_stations(self, from_station: str, to_station: str) -> List[Dict[str, Any]]:
         """Search trains that pass through both stations in correct order"""
-        try:
-            schedules = self.get_schedules()
-            results = []
-            
-            for train_key, schedule in schedules.items():
-                try:
-                    routes = schedule.get('data', {}).get('routes', [])
-                    route_stations = [route['city'] for route in routes]
-                    
-                    if from_station in route_stations and to_station in route_stations:
-                        from_idx = route_stations.index(from_station)
-                        to_idx = route_stations.index(to_station)
-                        
-                        if from_idx < to_idx:  # Correct direction
-                            results.append({
-                                'train_key': train_key,
-                                'schedule': schedule
-                            })
-                
-                except Exception as e:
-                    logger.warning(f"Error processing schedule for {train_key}: {e}")
-                    continue
-            
-            logger.info(f"Found {len(results)} trains between {from_station} and {to_station}")
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error searching trains by stations: {e}")
+        if not from_station or not to_station:
             return []
+        
+        snapshot = self.current()
+        schedules = snapshot.schedules
+        
+        # Trains are indexed by every ordered pair of their stops, so the
+        # lookup already enforces the direction of travel
+        results = [
+            {'train_key': train_key, 'schedule': schedules[train_key]}
+            for train_key in snapshot.od_index.get((from_station, to_station), ())
+        ]
+        
+        logger.info(f"Found {len(results)} trains between {from_station} and {to_station}")
+        return results
+    
+    def get_trains_at_station(self, station_name: str) -> Tuple[StationStop, ...]:
+        """Get a StationStop for every train stopping at a station"""
+        return self.current().station_stops.get(station_name, ())
     
     def search_trains_by_number(self, train_number: str) -> List[Dict[str, Any]]:
         """Search trains by number or partial name"""
-        try:
-            schedules = self.get_schedules()
-            results = []
-            
-            train_number_lower = train_number.lower()
-            
-            for train_key, schedule in schedules.items():
-                try:
-                    train_name = schedule.get('data', {}).get('train_name', '')
-                    train_key_lower = train_key.lower()
-                    
-                    if (train_number_lower in train_key_lower or 
-                        train_number_lower in train_name.lower()):
-                        results.append({
-                            'train_key': train_key,
-                            'schedule': schedule
-                        })
-                
-                except Exception as e:
-                    logger.warning(f"Error processing schedule for {train_key}: {e}")
-                    continue
-            
-            logger.info(f"Found {len(results)} trains matching '{train_number}'")
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error searching trains by number: {e}")
+        if not train_number:
             return []
+        
+        snapshot = self.current()
+        schedules = snapshot.schedules
+        train_number_lower = train_number.lower()
+        
+        results = [
+            {'train_key': train_key, 'schedule': schedules[train_key]}
+            for train_key, train_key_lower, train_name_lower in snapshot.search_index
+            if train_number_lower in train_key_lower or train_number_lower in train_name_lower
+        ]
+        
+        logger.info(f"Found {len(results)} trains matching '{train_number}'")
+        return results
     
     def get_all_train_numbers(self) -> List[str]:
         """Get list of all available train numbers"""
@@ -6,12 +6,31 @@ Generates realistic train delays based on various factors
 
 import random
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import math
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from itertools import repeat
 
 logger = logging.getLogger(__name__)
 
+# Number of recent delays kept per train and station
+HISTORY_LENGTH = 100
+
+# How long the wall-clock hour used for weather simulation is reused
+HOUR_CACHE_SECONDS = 5.0
+
+# Upper bounds (inclusive) of the delay distribution buckets; anything
+# above the last bound falls into the final label
+DELAY_BUCKET_BOUNDS = (15, 30, 60)
+DELAY_BUCKET_LABELS = ('0-15 min', '16-30 min', '31-60 min', '60+ min')
+
+# Day names in datetime.weekday() order, independent of the process locale
+WEEKDAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
 class DelaySimulator:
     """Simulates realistic train delays based on various factors"""
     
@@ -63,8 +82,29 @@ class DelaySimulator:
             'Mymensingh': 1.0
         }
         
-        # Historical delay patterns (simulated)
+        # Simulated weather options with cumulative weights (day: 60/30/10, night: 70/20/10)
+        self._day_weather = (('clear', 'cloudy', 'rainy'), (0.6, 0.9, 1.0))
+        self._night_weather = (('clear', 'cloudy', 'foggy'), (0.7, 0.9, 1.0))
+        
+        self._cached_hour = None
+        self._cached_hour_expires = 0.0
+        
+        # Per-hour and per-weekday factor tables (index by hour / weekday())
+        self._hour_factor = tuple(self._compute_hour_factor(hour) for hour in range(24))
+        self._day_factor = tuple(self.day_factors.get(day, 1.0) for day in WEEKDAY_NAMES)
+        
+        # Lowercased station patterns, in priority order, plus exact-name hits
+        self._station_keys_lc = tuple(
+            (pattern.lower(), factor) for pattern, factor in self.station_delay_factors.items()
+        )
+        self._station_factors_lc = {
+            pattern: self._match_station_factor(pattern) for pattern, _ in self._station_keys_lc
+        }
+        
+        # Historical delay patterns (simulated); request threads share this
+        # instance, so the patterns are only read or written under the lock
         self.historical_patterns = {}
+        self._history_lock = threading.Lock()
     
     def simulate_delay(self, train_number: str, current_station: str, 
                       scheduled_time: datetime, current_time: datetime,
@@ -119,16 +159,67 @@ class DelaySimulator:
                 'factors_applied': {}
             }
     
+    def simulate_delays_batch(self, train_number: str, station_names: List[str],
+                              scheduled_times: List[Optional[datetime]], current_time: datetime,
+                              weather_conditions: List[str],
+                              station_factors: Optional[List[float]] = None) -> List[int]:
+        """Simulate delay minutes for several stations at once (0 where there is no scheduled time)"""
+        try:
+            if station_factors is None:
+                station_factors = self.get_station_factors(station_names)
+            
+            # Time and day factors are shared by every station in the batch
+            time_factor = self._get_time_factor(current_time)
+            day_factor = self._get_day_factor(current_time)
+            weather_factors = self.weather_factors
+            calculate_base_delay = self._calculate_base_delay
+            update_history = self._update_historical_patterns
+            uniform = random.uniform
+            
+            delays = []
+            for station_name, scheduled_time, weather_condition, station_factor in zip(
+                station_names, scheduled_times, weather_conditions, station_factors
+            ):
+                if scheduled_time is None:
+                    delays.append(0)
+                    continue
+                
+                final_delay = (calculate_base_delay()
+                               * weather_factors.get(weather_condition, 1.0)
+                               * time_factor * day_factor
+                               * station_factor)
+                final_delay = int(final_delay * uniform(0.8, 1.2))
+                final_delay = max(0, min(final_delay, 120))  # Max 2 hours
+                
+                update_history(train_number, station_name, final_delay)
+                delays.append(final_delay)
+            
+            return delays
+            
+        except Exception as e:
+            logger.error(f"Error simulating batch delays: {e}")
+            return [0] * len(station_names)
+    
+    def get_station_factors(self, station_names: List[str]) -> List[float]:
+        """Get the station delay factor for each of several stations"""
+        return [self._get_station_factor(station_name) for station_name in station_names]
+    
     def _calculate_base_delay(self) -> int:
         """Calculate base delay based on probability"""
-        if random.random() < self.base_delay_probability:
-            return random.randint(*self.base_delay_range)
-        return 0
+        # One draw decides both whether there is a delay and, rescaled to
+        # [0, 1), how long it is within base_delay_range
+        draw = random.random()
+        if draw >= self.base_delay_probability:
+            return 0
+        low, high = self.base_delay_range
+        return low + int(draw / self.base_delay_probability * (high - low + 1))
     
     def _get_time_factor(self, current_time: datetime) -> float:
         """Get delay factor based on time of day"""
-        hour = current_time.hour
-        
+        return self._hour_factor[current_time.hour]
+    
+    def _compute_hour_factor(self, hour: int) -> float:
+        """Map an hour of the day to its time-of-day delay factor"""
         if 5 <= hour < 8:
             return self.time_factors['early_morning']
         elif 8 <= hour < 10:
@@ -146,56 +237,61 @@ class DelaySimulator:
     
     def _get_day_factor(self, current_time: datetime) -> float:
         """Get delay factor based on day of week"""
-        day_name = current_time.strftime('%A')
-        return self.day_factors.get(day_name, 1.0)
+        return self._day_factor[current_time.weekday()]
     
     def _get_station_factor(self, station_name: str) -> float:
         """Get delay factor based on station"""
-        for station_pattern, factor in self.station_delay_factors.items():
-            if station_pattern.lower() in station_name.lower():
+        name = station_name.lower()
+        factor = self._station_factors_lc.get(name)
+        if factor is not None:
+            return factor
+        return self._match_station_factor(name)
+    
+    def _match_station_factor(self, name: str) -> float:
+        """Return the factor of the first station pattern contained in a lowercased name"""
+        for pattern, factor in self._station_keys_lc:
+            if pattern in name:
                 return factor
         return 1.0
     
     def _update_historical_patterns(self, train_number: str, station: str, delay: int):
         """Update historical delay patterns for analysis"""
-        try:
-            if train_number not in self.historical_patterns:
-                self.historical_patterns[train_number] = {}
-            
-            if station not in self.historical_patterns[train_number]:
-                self.historical_patterns[train_number][station] = []
+        with self._history_lock:
+            train_patterns = self.historical_patterns.get(train_number)
+            if train_patterns is None:
+                train_patterns = self.historical_patterns[train_number] = {}
             
-            # Keep only last 100 delays for memory management
-            delays = self.historical_patterns[train_number][station]
-            delays.append({
-                'delay': delay,
-                'timestamp': datetime.now().isoformat()
-            })
+            history = train_patterns.get(station)
+            if history is None:
+                # Bounded deques drop the oldest entry in O(1) once full
+                history = train_patterns[station] = {
+                    'delays': deque(maxlen=HISTORY_LENGTH),
+                    'timestamps': deque(maxlen=HISTORY_LENGTH)
+                }
             
-            if len(delays) > 100:
-                delays.pop(0)
-                
-        except Exception as e:
-            logger.warning(f"Error updating historical patterns: {e}")
+            history['delays'].append(delay)
+            history['timestamps'].append(time.time())
     
     def get_historical_delay_stats(self, train_number: str, station: str = None) -> Dict[str, Any]:
         """Get historical delay statistics for a train or station"""
         try:
-            if train_number not in self.historical_patterns:
-                return {'error': 'No historical data available'}
-            
-            if station:
-                # Station-specific stats
-                if station not in self.historical_patterns[train_number]:
-                    return {'error': 'No data for this station'}
+            # Copy the delays under the lock so concurrent updates can't change them mid-read
+            with self._history_lock:
+                if train_number not in self.historical_patterns:
+                    return {'error': 'No historical data available'}
                 
-                delays = [d['delay'] for d in self.historical_patterns[train_number][station]]
-            else:
-                # All stations for this train
-                all_delays = []
-                for station_delays in self.historical_patterns[train_number].values():
-                    all_delays.extend([d['delay'] for d in station_delays])
-                delays = all_delays
+                if station:
+                    # Station-specific stats
+                    if station not in self.historical_patterns[train_number]:
+                        return {'error': 'No data for this station'}
+                    
+                    delays = list(self.historical_patterns[train_number][station]['delays'])
+                else:
+                    # All stations for this train
+                    all_delays = []
+                    for history in self.historical_patterns[train_number].values():
+                        all_delays.extend(history['delays'])
+                    delays = all_delays
             
             if not delays:
                 return {'error': 'No delay data available'}
@@ -214,24 +310,9 @@ class DelaySimulator:
     
     def _get_delay_distribution(self, delays: List[int]) -> Dict[str, int]:
         """Get distribution of delays by ranges"""
-        distribution = {
-            '0-15 min': 0,
-            '16-30 min': 0,
-            '31-60 min': 0,
-            '60+ min': 0
-        }
-        
-        for delay in delays:
-            if delay <= 15:
-                distribution['0-15 min'] += 1
-            elif delay <= 30:
-                distribution['16-30 min'] += 1
-            elif delay <= 60:
-                distribution['31-60 min'] += 1
-            else:
-                distribution['60+ min'] += 1
-        
-        return distribution
+        # bisect_left maps each delay straight to its bucket index
+        counts = Counter(map(bisect_left, repeat(DELAY_BUCKET_BOUNDS), delays))
+        return {label: counts[idx] for idx, label in enumerate(DELAY_BUCKET_LABELS)}
     
     def predict_delay_probability(self, train_number: str, station: str, 
                                 scheduled_time: datetime) -> Dict[str, Any]:
@@ -248,7 +329,9 @@ class DelaySimulator:
                 return {'delay_probability': 0.3, 'confidence': 'low'}
             
             # Calculate probability based on historical patterns
-            delayed_count = sum(1 for d in self.historical_patterns[train_number][station] if d['delay'] > 0)
+            with self._history_lock:
+                station_delays = list(self.historical_patterns[train_number][station]['delays'])
+            delayed_count = sum(1 for delay in station_delays if delay > 0)
             historical_probability = delayed_count / total_delays
             
             # Apply time and day factors
@@ -288,17 +371,31 @@ class DelaySimulator:
         # In a real system, this would call a weather API
         # For now, simulate based on time and random factors
         
-        current_hour = datetime.now().hour
+        conditions, cum_weights = self._get_weather_options()
+        return random.choices(conditions, cum_weights=cum_weights)[0]
+    
+    def get_weather_conditions(self, locations: List[str]) -> List[str]:
+        """Get simulated weather conditions for several locations in one draw"""
+        conditions, cum_weights = self._get_weather_options()
+        return random.choices(conditions, cum_weights=cum_weights, k=len(locations))
+    
+    def _get_weather_options(self) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+        """Get the weather conditions and cumulative weights for the current hour"""
+        current_hour = self._get_current_hour()
         
         # Simulate weather patterns
         if 6 <= current_hour <= 18:  # Daytime
-            conditions = ['clear', 'cloudy', 'rainy']
-            weights = [0.6, 0.3, 0.1]
+            return self._day_weather
         else:  # Nighttime
-            conditions = ['clear', 'cloudy', 'foggy']
-            weights = [0.7, 0.2, 0.1]
-        
-        return random.choices(conditions, weights=weights)[0]
+            return self._night_weather
+    
+    def _get_current_hour(self) -> int:
+        """Get the current wall-clock hour, refreshed every few seconds"""
+        now = time.monotonic()
+        if now >= self._cached_hour_expires:
+            self._cached_hour = datetime.now().hour
+            self._cached_hour_expires = now + HOUR_CACHE_SECONDS
+        return self._cached_hour
     
     def simulate_route_delays(self, route_stations: List[Dict[str, Any]], 
                              start_time: datetime) -> List[Dict[str, Any]]:
@@ -307,9 +404,11 @@ class DelaySimulator:
             simulated_route = []
             current_time = start_time
             
-            for i, station in enumerate(route_stations):
+            # Draw the weather for every station in one call
+            weathers = self.get_weather_conditions(route_stations)
+            
+            for station, weather in zip(route_stations, weathers):
                 # Simulate delay for this station
-                weather = self.get_weather_condition(station.get('city', ''))
                 
                 if 'departure_time' in station and station['departure_time']:
                     scheduled_departure = self._parse_time_string(station['departure_time'])
@@ -328,9 +427,9 @@ class DelaySimulator:
                         
                         simulated_route.append(simulated_station)
                         
-                        # Update current time for next station
-                        if delay_info['actual_time']:
-                            current_time = datetime.fromisoformat(delay_info['actual_time'])
+                        # Update current time for next station; the actual time is
+                        # the scheduled departure plus the delay, so skip re-parsing it
+                        current_time = scheduled_departure + timedelta(minutes=delay_info['delay_minutes'])
                     else:
                         simulated_route.append(station)
                 else:
@@ -360,6 +459,9 @@ class DelaySimulator:
             logger.warning(f"Error parsing time string '{time_str}': {e}")
             return None
 
+# Global instance
+delay_simulator = DelaySimulator()
+
 def get_delay_simulator() -> DelaySimulator:
-    """Get a delay simulator instance"""
-    return DelaySimulator()
+    """Get the global delay simulator instance"""
+    return delay_simulator
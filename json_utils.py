@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+JSON Utilities Module for TrainJatri Backend
+Fast JSON encoding/decoding using orjson, falling back to the standard library
+"""
+
+import json
+import mmap
+import os
+from typing import Any, Iterator, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - ijson is optional
+    ijson = None
+
+# Files larger than this are memory-mapped instead of read into a buffer
+MMAP_THRESHOLD = 256 * 1024
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize an object to UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=str, option=option)
+    return json.dumps(
+        obj, indent=2 if indent else None, default=str, ensure_ascii=False
+    ).encode('utf-8')
+
+def load_file(path: str) -> Any:
+    """Read and parse a JSON file, memory-mapping it when large"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+            return loads(f.read())
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return loads(view)
+
+def iter_items(path: str, prefix: str = '') -> Iterator[Tuple[str, Any]]:
+    """Yield the key/value pairs of the object at a dotted prefix, streaming large files"""
+    if ijson is not None and os.path.getsize(path) >= MMAP_THRESHOLD:
+        with open(path, 'rb') as f:
+            yield from ijson.kvitems(f, prefix, use_float=True)
+        return
+    
+    data = load_file(path)
+    for key in prefix.split('.') if prefix else []:
+        data = data[key]
+    yield from data.items()
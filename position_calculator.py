@@ -9,58 +9,122 @@ import logging
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import random
+import weakref
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+try:
+    from numba import njit
+except ImportError:  # pragma: no cover - numba is optional
+    njit = None
 
 logger = logging.getLogger(__name__)
 
+# Speed multiplier per hour: slower in the 6-9 and 17-20 rush hours,
+# faster overnight (22-5)
+SPEED_MULTIPLIER_BY_HOUR = tuple(
+    0.8 if 6 <= hour <= 9 or 17 <= hour <= 20 else 1.2 if hour >= 22 or hour <= 5 else 1.0
+    for hour in range(24)
+)
+
+def _haversine(lat1_rad: float, lon1_rad: float, lat2_rad: float, lon2_rad: float,
+               radius: float) -> float:
+    """Great-circle distance between two points given in radians"""
+    delta_lat = lat2_rad - lat1_rad
+    delta_lon = lon2_rad - lon1_rad
+    a = (math.sin(delta_lat / 2) ** 2 + 
+         math.cos(lat1_rad) * math.cos(lat2_rad) * 
+         math.sin(delta_lon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return radius * c
+
+# Compile the kernel when numba is installed; it is pure float arithmetic
+if njit is not None:
+    _haversine = njit(cache=True, fastmath=True)(_haversine)
+
 class PositionCalculator:
     """Calculates train positions, distances, and coordinates"""
     
     def __init__(self, data_loader):
         self.data_loader = data_loader
         self.earth_radius = 6371  # Earth radius in kilometers
+        self._stations = None
+        self._station_idx = {}
+        self._lat_rad = array('d')
+        self._lon_rad = array('d')
+        self._distance_cache = {}
+        self._departure_cache = {}
+        
+    def _refresh_station_cache(self, stations: Dict[str, List[float]]):
+        """Precompute station coordinates in radians and reset memoized distances"""
+        station_idx = {}
+        lat_rad = array('d')
+        lon_rad = array('d')
         
+        for name, coords in stations.items():
+            try:
+                lon, lat = coords  # Stored as [longitude, latitude]
+                lat, lon = math.radians(lat), math.radians(lon)
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping station with malformed coordinates: {name}")
+                continue
+            station_idx[name] = len(lat_rad)
+            lat_rad.append(lat)
+            lon_rad.append(lon)
+        
+        self._station_idx = station_idx
+        self._lat_rad = lat_rad
+        self._lon_rad = lon_rad
+        self._distance_cache = {}
+        self._stations = stations
+    
     def calculate_distance_between_stations(self, station1: str, station2: str) -> float:
         """Calculate distance between two stations using Haversine formula"""
         try:
-            stations = self.data_loader.get_stations()
-            
-            if station1 not in stations or station2 not in stations:
-                logger.warning(f"Station not found: {station1} or {station2}")
-                return 0.0
-            
-            # Get coordinates [longitude, latitude]
-            lon1, lat1 = stations[station1]
-            lon2, lat2 = stations[station2]
-            
-            # Convert to radians
-            lat1_rad = math.radians(lat1)
-            lat2_rad = math.radians(lat2)
-            delta_lat = math.radians(lat2 - lat1)
-            delta_lon = math.radians(lon2 - lon1)
-            
-            # Haversine formula
-            a = (math.sin(delta_lat / 2) ** 2 + 
-                 math.cos(lat1_rad) * math.cos(lat2_rad) * 
-                 math.sin(delta_lon / 2) ** 2)
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-            
-            distance = self.earth_radius * c
-            return round(distance, 2)
+            self._ensure_station_cache()
+            return self._station_distance(station1, station2)
             
         except Exception as e:
             logger.error(f"Error calculating distance between stations: {e}")
             return 0.0
     
+    def _ensure_station_cache(self):
+        """Rebuild the coordinate arrays if the loader's stations were replaced"""
+        stations = self.data_loader.get_stations()
+        if stations is not self._stations:
+            self._refresh_station_cache(stations)
+    
+    def _station_distance(self, station1: str, station2: str) -> float:
+        """Rounded distance between two stations, memoized against the current station cache"""
+        # Distances are symmetric, so both orders share one cache entry
+        key = (station1, station2) if station1 <= station2 else (station2, station1)
+        distance = self._distance_cache.get(key)
+        if distance is not None:
+            return distance
+        
+        idx1 = self._station_idx.get(key[0])
+        idx2 = self._station_idx.get(key[1])
+        if idx1 is None or idx2 is None:
+            logger.warning(f"Station not found: {station1} or {station2}")
+            return 0.0
+        
+        lat_rad = self._lat_rad
+        lon_rad = self._lon_rad
+        distance = round(_haversine(lat_rad[idx1], lon_rad[idx1], lat_rad[idx2], lon_rad[idx2],
+                                    self.earth_radius), 2)
+        self._distance_cache[key] = distance
+        return distance
+    
     def calculate_total_route_distance(self, route_stations: List[str]) -> float:
         """Calculate total distance of a route"""
         try:
-            total_distance = 0.0
-            
-            for i in range(len(route_stations) - 1):
-                distance = self.calculate_distance_between_stations(
-                    route_stations[i], route_stations[i + 1]
-                )
-                total_distance += distance
+            # Check the station cache once, then pair each station with its successor
+            self._ensure_station_cache()
+            total_distance = sum(map(
+                self._station_distance,
+                route_stations, route_stations[1:]
+            ), 0.0)
             
             return round(total_distance, 2)
             
@@ -80,7 +144,7 @@ class PositionCalculator:
                 return {"error": "No routes found in schedule"}
             
             # Find current position based on time
-            current_station_idx = self._find_current_station_index(routes, current_time)
+            current_station_idx = self._find_current_station_index(train_number, routes, current_time)
             
             if current_station_idx is None:
                 return {"error": "Unable to determine current position"}
@@ -112,23 +176,46 @@ class PositionCalculator:
             logger.error(f"Error calculating train position: {e}")
             return {"error": str(e)}
     
-    def _find_current_station_index(self, routes: List[Dict[str, Any]], current_time: datetime) -> Optional[int]:
+    def _find_current_station_index(self, train_number: str, routes: List[Dict[str, Any]],
+                                    current_time: datetime) -> Optional[int]:
         """Find the current station index based on time"""
-        try:
-            for i, route in enumerate(routes):
-                if 'departure_time' in route and route['departure_time']:
-                    try:
-                        departure_time = self._parse_time_string(route['departure_time'])
-                        if departure_time and departure_time > current_time:
-                            return max(0, i - 1)
-                    except:
-                        continue
-            
-            return len(routes) - 1
-            
-        except Exception as e:
-            logger.error(f"Error finding current station index: {e}")
-            return None
+        # Departure times are today's wall-clock times, so compare them as
+        # seconds since today's midnight
+        day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        current_offset = (current_time - day_start).total_seconds()
+        
+        route_indices, running_max = self._get_departure_offsets(train_number, routes)
+        
+        # The first departure later than now is also the first point where
+        # the running maximum exceeds now, and that sequence is sorted
+        pos = bisect_right(running_max, current_offset)
+        if pos < len(route_indices):
+            return max(0, route_indices[pos] - 1)
+        
+        return len(routes) - 1
+    
+    def _get_departure_offsets(self, train_number: str,
+                               routes: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        """Get departure route indices and running-max departure offsets, parsing once per schedule"""
+        cached = self._departure_cache.get(train_number)
+        if cached is not None and cached[0] is routes:
+            return cached[1]
+        
+        route_indices = []
+        offsets = []
+        for i, route in enumerate(routes):
+            if 'departure_time' in route and route['departure_time']:
+                departure_time = self._parse_time_string(route['departure_time'])
+                if departure_time:
+                    route_indices.append(i)
+                    offsets.append(departure_time.hour * 3600 + departure_time.minute * 60)
+        
+        # Overnight routes wrap past midnight, so search over the running maximum
+        result = (route_indices, list(accumulate(offsets, max)))
+        
+        # Keep the routes list alongside so a reloaded schedule is re-parsed
+        self._departure_cache[train_number] = (routes, result)
+        return result
     
     def _parse_time_string(self, time_str: str) -> Optional[datetime]:
         """Parse time string in format 'HH:MM am/pm BST'"""
@@ -150,66 +237,51 @@ class PositionCalculator:
     
     def _calculate_distance_covered(self, routes: List[Dict[str, Any]], current_idx: int) -> float:
         """Calculate total distance covered up to current station"""
-        try:
-            total_distance = 0.0
-            
-            for i in range(current_idx):
-                if i + 1 < len(routes):
-                    distance = self.calculate_distance_between_stations(
-                        routes[i]['city'], routes[i + 1]['city']
-                    )
-                    total_distance += distance
-            
-            return total_distance
-            
-        except Exception as e:
-            logger.error(f"Error calculating distance covered: {e}")
-            return 0.0
+        total_distance = 0.0
+        
+        for i in range(current_idx):
+            if i + 1 < len(routes):
+                distance = self.calculate_distance_between_stations(
+                    routes[i]['city'], routes[i + 1]['city']
+                )
+                total_distance += distance
+        
+        return total_distance
     
     def _calculate_distance_to_next(self, routes: List[Dict[str, Any]], current_idx: int) -> float:
         """Calculate distance to next station"""
-        try:
-            if current_idx + 1 >= len(routes):
-                return 0.0
-            
-            return self.calculate_distance_between_stations(
-                routes[current_idx]['city'], routes[current_idx + 1]['city']
-            )
-            
-        except Exception as e:
-            logger.error(f"Error calculating distance to next: {e}")
+        if current_idx + 1 >= len(routes):
             return 0.0
+        
+        return self.calculate_distance_between_stations(
+            routes[current_idx]['city'], routes[current_idx + 1]['city']
+        )
     
     def _calculate_eta_to_next(self, routes: List[Dict[str, Any]], current_idx: int, current_time: datetime) -> Optional[str]:
         """Calculate ETA to next station"""
-        try:
-            if current_idx + 1 >= len(routes):
-                return None
-            
-            next_route = routes[current_idx + 1]
-            if 'arrival_time' not in next_route or not next_route['arrival_time']:
-                return None
-            
-            arrival_time = self._parse_time_string(next_route['arrival_time'])
-            if not arrival_time:
-                return None
-            
-            time_diff = arrival_time - current_time
-            
-            if time_diff.total_seconds() <= 0:
-                return "Arrived"
-            
-            hours = int(time_diff.total_seconds() // 3600)
-            minutes = int((time_diff.total_seconds() % 3600) // 60)
-            
-            if hours > 0:
-                return f"{hours}h {minutes}m"
-            else:
-                return f"{minutes}m"
-                
-        except Exception as e:
-            logger.error(f"Error calculating ETA to next: {e}")
+        if current_idx + 1 >= len(routes):
+            return None
+        
+        next_route = routes[current_idx + 1]
+        if 'arrival_time' not in next_route or not next_route['arrival_time']:
             return None
+        
+        arrival_time = self._parse_time_string(next_route['arrival_time'])
+        if not arrival_time:
+            return None
+        
+        time_diff = arrival_time - current_time
+        
+        if time_diff.total_seconds() <= 0:
+            return "Arrived"
+        
+        hours = int(time_diff.total_seconds() // 3600)
+        minutes = int((time_diff.total_seconds() % 3600) // 60)
+        
+        if hours > 0:
+            return f"{hours}h {minutes}m"
+        else:
+            return f"{minutes}m"
     
     def estimate_train_speed(self, train_number: str, current_time: datetime) -> float:
         """Estimate current train speed based on schedule and position"""
@@ -219,14 +291,7 @@ class PositionCalculator:
                 return 0.0
             
             base_speed = 60.0  # km/h base speed
-            
-            hour = current_time.hour
-            if 6 <= hour <= 9 or 17 <= hour <= 20:
-                speed_multiplier = 0.8
-            elif 22 <= hour or hour <= 5:
-                speed_multiplier = 1.2
-            else:
-                speed_multiplier = 1.0
+            speed_multiplier = SPEED_MULTIPLIER_BY_HOUR[current_time.hour]
             
             random_factor = random.uniform(0.9, 1.1)
             estimated_speed = base_speed * speed_multiplier * random_factor
@@ -236,6 +301,13 @@ class PositionCalculator:
             logger.error(f"Error estimating train speed: {e}")
             return 0.0
 
+# One calculator per data loader, released once nothing else references it
+_position_calculators = weakref.WeakValueDictionary()
+
 def get_position_calculator(data_loader) -> PositionCalculator:
-    """Get a position calculator instance"""
-    return PositionCalculator(data_loader)
+    """Get the shared position calculator for a data loader"""
+    calculator = _position_calculators.get(id(data_loader))
+    if calculator is None:
+        calculator = PositionCalculator(data_loader)
+        _position_calculators[id(data_loader)] = calculator
+    return calculator
@@ -4,40 +4,37 @@ TrainJatri App Runner Script
 This script helps you run the TrainJatri application with both backend and frontend.
 """
 
+import shutil
 import subprocess
 import sys
 import os
 import time
 import webbrowser
+from importlib.util import find_spec
 from pathlib import Path
 
 def check_python_dependencies():
     """Check if required Python packages are installed"""
-    try:
-        import flask
-        import flask_cors
-        print("✅ Python dependencies are installed")
-        return True
-    except ImportError as e:
-        print(f"❌ Missing Python dependency: {e}")
+    # find_spec locates the packages without importing them
+    missing = [name for name in ('flask', 'flask_cors') if find_spec(name) is None]
+    if missing:
+        print(f"❌ Missing Python dependency: {', '.join(missing)}")
         print("Please install dependencies with: pip install -r requirements.txt")
         return False
+    
+    print("✅ Python dependencies are installed")
+    return True
 
 def check_flutter():
     """Check if Flutter is installed and available"""
-    try:
-        result = subprocess.run(['flutter', '--version'], 
-                              capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✅ Flutter is installed")
-            return True
-        else:
-            print("❌ Flutter is not working properly")
-            return False
-    except FileNotFoundError:
+    # A PATH lookup avoids booting the Flutter/Dart toolchain just to check for it
+    if shutil.which('flutter') is None:
         print("❌ Flutter is not installed or not in PATH")
         print("Please install Flutter from: https://flutter.dev/docs/get-started/install")
         return False
+    
+    print("✅ Flutter is installed")
+    return True
 
 def run_backend():
     """Run the Flask backend server"""
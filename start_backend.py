@@ -8,8 +8,9 @@ import os
 import sys
 import time
 import logging
+import shutil
 import subprocess
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Configure logging
 logging.basicConfig(
@@ -55,10 +56,12 @@ def check_data_files():
         'schedules/'
     ]
     
-    missing_files = []
-    for file_path in required_files:
-        if not Path(file_path).exists():
-            missing_files.append(file_path)
+    # One directory listing instead of a stat() per file; directories get a
+    # trailing slash so 'schedules/' only matches a directory
+    with os.scandir('.') as entries:
+        present = {entry.name + ('/' if entry.is_dir() else '') for entry in entries}
+    
+    missing_files = [file_path for file_path in required_files if file_path not in present]
     
     if missing_files:
         logger.error(f"Missing data files: {', '.join(missing_files)}")
@@ -89,17 +92,59 @@ def validate_data_integrity():
         return False
 
 def check_port_availability(port=5000):
-    """Check if the specified port is available"""
+    """Check that the port can be bound and nothing is already serving on it"""
     import socket
     
     try:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            # Match the server's SO_REUSEADDR so sockets left in TIME_WAIT
+            # are judged the way the real bind will see them
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.bind(('localhost', port))
-            logger.info(f"Port {port} is available")
-            return True
-    except OSError:
+            s.listen(1)
+    except (OSError, OverflowError):
         logger.error(f"Port {port} is already in use")
         return False
+    
+    # Some platforms let a localhost bind succeed beside a wildcard listener, so probe for one
+    try:
+        with socket.create_connection(('localhost', port), timeout=0.1):
+            pass
+    except OSError:
+        logger.info(f"Port {port} is available")
+        return True
+    
+    logger.error(f"Port {port} is already in use")
+    return False
+
+def run_startup_checks():
+    """Run the independent startup checks concurrently, stopping at the first failure"""
+    checks = {
+        'dependencies': check_dependencies,
+        'data_files': check_data_files,
+        'data_integrity': validate_data_integrity,
+        'port': check_port_availability
+    }
+    results = {}
+    
+    executor = ThreadPoolExecutor(max_workers=len(checks))
+    futures = {executor.submit(check): name for name, check in checks.items()}
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Startup check '{name}' raised an error: {e}")
+                results[name] = False
+            
+            # Missing dependencies can still be installed, so keep going
+            if not results[name] and name != 'dependencies':
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return results
 
 def install_dependencies():
     """Install required dependencies"""
@@ -114,13 +159,30 @@ def install_dependencies():
         logger.error(f"Error output: {e.stderr}")
         return False
 
+def run_gunicorn(config):
+    """Serve the app with a single threaded gunicorn worker"""
+    # Crowd validations are appended to and compacted from one process's memory,
+    # so exactly one worker may own the log; scale with threads instead
+    command = [
+        'gunicorn',
+        '-k', 'gthread',
+        '-w', '1',
+        '--threads', str(config.WORKER_THREADS),
+        '--preload',
+        '-b', f'{config.HOST}:{config.PORT}',
+        'train_timeline_api:app'
+    ]
+    logger.info(f"Starting gunicorn with 1 worker x {config.WORKER_THREADS} threads")
+    
+    # Load data once in the master so the forked worker shares it copy-on-write
+    env = {**os.environ, 'PRELOAD_DATA': 'true'}
+    return subprocess.run(command, env=env).returncode == 0
+
 def start_backend():
     """Start the backend server"""
     logger.info("Starting TrainJatri Backend...")
     
     try:
-        # Import and start the Flask app
-        from train_timeline_api import app
         from config import get_config
         
         # Get configuration
@@ -130,6 +192,13 @@ def start_backend():
         logger.info(f"Debug mode: {config.DEBUG}")
         logger.info(f"API version: {config.API_VERSION}")
         
+        # Outside debug mode, serve with gunicorn when it is installed
+        if not config.DEBUG and shutil.which('gunicorn'):
+            return run_gunicorn(config)
+        
+        # Import and start the Flask app
+        from train_timeline_api import app
+        
         # Start the server
         app.run(
             host=config.HOST,
@@ -181,32 +250,28 @@ def main():
     if not check_python_version():
         sys.exit(1)
     
-    # Step 2: Check dependencies
-    logger.info("Step 2: Checking dependencies...")
-    if not check_dependencies():
-        logger.info("Attempting to install dependencies...")
-        if not install_dependencies():
-            logger.error("Failed to install dependencies. Please install manually.")
-            sys.exit(1)
+    # Steps 2-5: Check dependencies, data files, data integrity and port together
+    logger.info("Steps 2-5: Checking dependencies, data files, data integrity and port...")
+    results = run_startup_checks()
     
-    # Step 3: Check data files
-    logger.info("Step 3: Checking data files...")
-    if not check_data_files():
+    if results.get('data_files') is False:
         logger.error("Required data files are missing. Please ensure all data files are present.")
         sys.exit(1)
     
-    # Step 4: Validate data integrity
-    logger.info("Step 4: Validating data integrity...")
-    if not validate_data_integrity():
+    if results.get('data_integrity') is False:
         logger.error("Data validation failed. Please check your data files.")
         sys.exit(1)
     
-    # Step 5: Check port availability
-    logger.info("Step 5: Checking port availability...")
-    if not check_port_availability():
+    if results.get('port') is False:
         logger.error("Port 5000 is not available. Please free up the port or change the configuration.")
         sys.exit(1)
     
+    if results.get('dependencies') is False:
+        logger.info("Attempting to install dependencies...")
+        if not install_dependencies():
+            logger.error("Failed to install dependencies. Please install manually.")
+            sys.exit(1)
+    
     # Step 6: Start backend
     logger.info("Step 6: Starting backend server...")
     if not start_backend():
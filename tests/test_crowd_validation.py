@@ -0,0 +1,210 @@
+"""Tests for the crowd validation snapshot and event log"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import crowd_validation
+from crowd_validation import CrowdValidation
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    return str(tmp_path / "cv.json")
+
+
+def user_ids(validation, train_number):
+    return [conf['user_id'] for conf in validation.validations[train_number]['confirmations']]
+
+
+def write_snapshot(data_file, validations):
+    with open(data_file, 'w') as f:
+        json.dump(validations, f)
+
+
+def test_add_update_remove_replayed_after_restart(data_file):
+    cv = CrowdValidation(data_file)
+    assert cv.confirm_user_on_train('701', 'alice', 'Dhaka')['message'] == 'Confirmation added'
+    cv.confirm_user_on_train('701', 'bob')
+    cv.confirm_user_on_train('702', 'carol')
+    assert cv.confirm_user_on_train('701', 'alice', 'Tongi')['message'] == 'Confirmation updated'
+    assert cv.remove_user_confirmation('702', 'carol')['success']
+    cv.flush()
+    
+    assert not os.path.exists(data_file)
+    restarted = CrowdValidation(data_file)
+    assert restarted.counters() == cv.counters() == (2, 2, 2)
+    assert user_ids(restarted, '701') == ['bob', 'alice']
+    assert restarted.validations['701']['confirmations'][1]['station_name'] == 'Tongi'
+    assert restarted.validations['702']['confirmations'] == []
+    assert 'ts_epoch' not in restarted.validations['701']['confirmations'][0]
+
+
+def test_torn_last_line_is_skipped(data_file):
+    cv = CrowdValidation(data_file)
+    cv.confirm_user_on_train('701', 'alice')
+    cv.confirm_user_on_train('701', 'bob')
+    cv.flush()
+    with open(cv.log_file, 'ab') as f:
+        f.write(b'{"op": "add", "train": "701", "us')
+    
+    restarted = CrowdValidation(data_file)
+    assert user_ids(restarted, '701') == ['alice', 'bob']
+    assert restarted.counters() == (1, 2, 2)
+
+
+def test_compaction_writes_snapshot_and_truncates_log(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation, 'COMPACT_MIN_LOG_BYTES', 0)
+    cv = CrowdValidation(data_file)
+    cv.confirm_user_on_train('701', 'alice')
+    cv.confirm_user_on_train('701', 'bob')
+    cv.flush()
+    
+    assert os.path.getsize(cv.log_file) == 0
+    with open(data_file) as f:
+        snapshot = json.load(f)
+    assert [conf['user_id'] for conf in snapshot['701']['confirmations']] == ['alice', 'bob']
+    assert CrowdValidation(data_file).counters() == (1, 2, 2)
+
+
+def test_failed_snapshot_keeps_log(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation, 'COMPACT_MIN_LOG_BYTES', 0)
+    # A directory in the way makes the snapshot write fail
+    os.mkdir(f"{data_file}.tmp")
+    cv = CrowdValidation(data_file)
+    cv.confirm_user_on_train('701', 'alice')
+    cv.confirm_user_on_train('701', 'bob')
+    cv.flush()
+    
+    assert not os.path.exists(data_file)
+    assert os.path.getsize(cv.log_file) > 0
+    restarted = CrowdValidation(data_file)
+    assert user_ids(restarted, '701') == ['alice', 'bob']
+    assert restarted.counters() == (1, 2, 2)
+
+
+def test_replay_after_compaction_round_trip(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation, 'COMPACT_MIN_LOG_BYTES', 0)
+    cv = CrowdValidation(data_file)
+    cv.confirm_user_on_train('701', 'alice', 'Dhaka', {'lat': 23.7, 'lon': 90.4})
+    cv.confirm_user_on_train('701', 'bob')
+    cv.confirm_user_on_train('702', 'carol')
+    cv.flush()
+    assert os.path.exists(data_file)
+    
+    # Events after the compaction live only in the log
+    monkeypatch.setattr(crowd_validation, 'COMPACT_MIN_LOG_BYTES', 10 ** 9)
+    cv.confirm_user_on_train('701', 'alice', 'Tongi')
+    cv.remove_user_confirmation('701', 'bob')
+    cv.confirm_user_on_train('703', 'dave')
+    cv.flush()
+    assert os.path.getsize(cv.log_file) > 0
+    
+    restarted = CrowdValidation(data_file)
+    assert restarted.validations == cv.validations
+    assert restarted.counters() == cv.counters() == (3, 3, 3)
+    for train_number in ('701', '702', '703'):
+        assert restarted.get_train_crowd_data(train_number) == cv.get_train_crowd_data(train_number)
+    
+    # Compacting the restarted instance leaves the same state on disk
+    restarted._compact()
+    assert CrowdValidation(data_file).validations == cv.validations
+
+
+def test_counters_after_cleanup(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation, 'COMPACT_MIN_LOG_BYTES', 10 ** 9)
+    now = datetime.now()
+    old = (now - timedelta(hours=30)).isoformat()
+    stale = (now - timedelta(hours=5)).isoformat()
+    write_snapshot(data_file, {
+        '701': {
+            'confirmations': [
+                {'user_id': 'alice', 'timestamp': old, 'station_name': None, 'coordinates': None},
+                {'user_id': 'bob', 'timestamp': stale, 'station_name': None, 'coordinates': None}
+            ],
+            'last_updated': stale,
+            'total_confirmations': 2
+        },
+        '702': {
+            'confirmations': [
+                {'user_id': 'carol', 'timestamp': old, 'station_name': None, 'coordinates': None}
+            ],
+            'last_updated': old,
+            'total_confirmations': 1
+        }
+    })
+    cv = CrowdValidation(data_file)
+    cv.confirm_user_on_train('701', 'dave')
+    assert cv.counters() == (2, 4, 1)
+    
+    assert cv.cleanup_old_validations() == 1
+    assert cv.counters() == (1, 2, 1)
+    assert user_ids(cv, '701') == ['bob', 'dave']
+    
+    # Cleanup compacts, so a restart sees the same state
+    assert not cv._pending
+    assert not os.path.exists(cv.log_file) or os.path.getsize(cv.log_file) == 0
+    assert CrowdValidation(data_file).counters() == (1, 2, 1)
+
+
+@pytest.mark.parametrize('snapshot', [
+    {'701': {'last_updated': None, 'total_confirmations': 0}},
+    {'701': {'confirmations': [None], 'last_updated': None, 'total_confirmations': 1}},
+    {'701': {'confirmations': [], 'last_updated': None}},
+    ['not', 'a', 'mapping']
+])
+def test_malformed_snapshot_starts_empty(data_file, snapshot):
+    write_snapshot(data_file, snapshot)
+    cv = CrowdValidation(data_file)
+    assert cv.validations == {}
+    assert cv.counters() == (0, 0, 0)
+    
+    cv.confirm_user_on_train('701', 'alice')
+    assert cv.counters() == (1, 1, 1)
+
+
+def confirm_users(validation, train_number, count):
+    for i in range(count):
+        validation.confirm_user_on_train(train_number, f"user{i}")
+
+
+def test_status_unchanged_without_enough_confirmations(data_file):
+    cv = CrowdValidation(data_file)
+    confirm_users(cv, '701', 3)
+    base_status = {'delay_minutes': 10}
+    
+    assert cv.adjust_train_status_with_crowd_data('701', base_status) is base_status
+    assert cv.adjust_train_status_with_crowd_data('702', base_status) is base_status
+
+
+def test_status_adjusted_with_medium_confidence(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation.random, 'random', lambda: 0.99)
+    cv = CrowdValidation(data_file)
+    confirm_users(cv, '701', 4)
+    base_status = {'delay_minutes': 10}
+    
+    adjusted = cv.adjust_train_status_with_crowd_data('701', base_status)
+    # 4 users is a medium crowd, adjusted by up to 2 minutes
+    assert adjusted['delay_minutes'] == 12
+    assert adjusted['crowd_validation']['confidence'] == 'medium'
+    assert adjusted['crowd_validation']['active_users'] == 4
+    assert 'eta_adjusted_by_crowd' not in adjusted
+    assert base_status == {'delay_minutes': 10}
+
+
+def test_status_adjustment_scaled_with_high_confidence(data_file, monkeypatch):
+    monkeypatch.setattr(crowd_validation.random, 'random', lambda: 0.0)
+    cv = CrowdValidation(data_file)
+    confirm_users(cv, '701', 12)
+    
+    adjusted = cv.adjust_train_status_with_crowd_data('701', {'delay_minutes': 20})
+    # 12 users is a high crowd: -5 minutes, scaled x1.5 above 10 users
+    assert adjusted['delay_minutes'] == 13
+    assert adjusted['crowd_validation']['crowd_level'] == 'high'
+    assert adjusted['eta_adjusted_by_crowd'] is True
+    assert adjusted['crowd_eta_confidence'] == 'high'
+    
+    # Delays never go negative
+    assert cv.adjust_train_status_with_crowd_data('701', {'delay_minutes': 3})['delay_minutes'] == 0
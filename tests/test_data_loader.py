@@ -0,0 +1,149 @@
+"""Tests for the data loader's schedule cache and station pair index"""
+
+import json
+import os
+import pickle
+import shutil
+
+import pytest
+
+from data_loader import DataLoader
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def route(city):
+    return {'city': city, 'arrival_time': None, 'departure_time': None, 'halt': None, 'duration': None}
+
+
+def write_schedule(data_dir, train_key, cities, train_name=None):
+    schedules_dir = os.path.join(data_dir, 'schedules')
+    os.makedirs(schedules_dir, exist_ok=True)
+    path = os.path.join(schedules_dir, f"{train_key}.json")
+    with open(path, 'w') as f:
+        json.dump({'data': {
+            'train_name': train_name or train_key,
+            'days': [],
+            'routes': [route(city) for city in cities]
+        }}, f)
+    return path
+
+
+def baseline_search(schedules, from_station, to_station):
+    """The original linear scan over every schedule"""
+    results = []
+    for train_key, schedule in schedules.items():
+        route_stations = [r['city'] for r in schedule.get('data', {}).get('routes', [])]
+        if from_station in route_stations and to_station in route_stations:
+            if route_stations.index(from_station) < route_stations.index(to_station):
+                results.append(train_key)
+    return results
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    write_schedule(str(tmp_path), 'UP_701', ['Dhaka', 'Tongi', 'Bhairab', 'Chattogram'])
+    write_schedule(str(tmp_path), 'DOWN_702', ['Chattogram', 'Bhairab', 'Tongi', 'Dhaka'])
+    # Revisits Tongi; its first stop decides the direction
+    write_schedule(str(tmp_path), 'LOOP_703', ['Tongi', 'Dhaka', 'Tongi', 'Joydebpur'])
+    return str(tmp_path)
+
+
+def test_station_search_matches_linear_scan(data_dir):
+    loader = DataLoader(data_dir)
+    schedules = loader.get_schedules()
+    stations = ['Dhaka', 'Tongi', 'Bhairab', 'Chattogram', 'Joydebpur', 'Sylhet']
+    
+    for from_station in stations:
+        for to_station in stations:
+            found = [r['train_key'] for r in loader.search_trains_by_stations(from_station, to_station)]
+            assert found == baseline_search(schedules, from_station, to_station), (from_station, to_station)
+
+
+def test_station_search_respects_direction(data_dir):
+    loader = DataLoader(data_dir)
+    
+    assert [r['train_key'] for r in loader.search_trains_by_stations('Dhaka', 'Chattogram')] == ['UP_701']
+    assert [r['train_key'] for r in loader.search_trains_by_stations('Chattogram', 'Dhaka')] == ['DOWN_702']
+    assert sorted(r['train_key'] for r in loader.search_trains_by_stations('Tongi', 'Dhaka')) == ['DOWN_702', 'LOOP_703']
+    assert loader.search_trains_by_stations('Dhaka', 'Dhaka') == []
+    assert loader.search_trains_by_stations('', 'Dhaka') == []
+    
+    assert [r['train_key'] for r in loader.search_trains_by_stations('Dhaka', 'Joydebpur')] == ['LOOP_703']
+
+
+def test_station_search_matches_linear_scan_on_repo_data(tmp_path):
+    shutil.copytree(os.path.join(REPO_DIR, 'schedules'), tmp_path / 'schedules')
+    loader = DataLoader(str(tmp_path))
+    schedules = loader.get_schedules()
+    assert schedules
+    
+    pairs = set()
+    for schedule in list(schedules.values())[:20]:
+        cities = [r['city'] for r in schedule['data']['routes']]
+        pairs.update(zip(cities, cities[2:]))
+        pairs.update(zip(cities[2:], cities))
+    
+    for from_station, to_station in sorted(pairs):
+        found = [r['train_key'] for r in loader.search_trains_by_stations(from_station, to_station)]
+        assert found == baseline_search(schedules, from_station, to_station), (from_station, to_station)
+
+
+def count_parses(monkeypatch):
+    calls = []
+    original = DataLoader._load_json_files
+    
+    def counting(self, paths):
+        # Route mappings go through the same loader, so only count schedule parses
+        if any(os.path.basename(os.path.dirname(path)) == 'schedules' for path in paths):
+            calls.append(len(paths))
+        return original(self, paths)
+    
+    monkeypatch.setattr(DataLoader, '_load_json_files', counting)
+    return calls
+
+
+def test_schedule_cache_reused_when_unchanged(data_dir, monkeypatch):
+    calls = count_parses(monkeypatch)
+    first = DataLoader(data_dir).get_schedules()
+    assert os.path.exists(os.path.join(data_dir, 'schedules.cache.pkl'))
+    
+    second = DataLoader(data_dir).get_schedules()
+    assert second == first
+    assert calls == [3]
+
+
+def test_schedule_cache_invalidated_by_modified_file(data_dir, monkeypatch):
+    calls = count_parses(monkeypatch)
+    DataLoader(data_dir).get_schedules()
+    
+    path = write_schedule(data_dir, 'UP_701', ['Dhaka', 'Airport'])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    
+    schedules = DataLoader(data_dir).get_schedules()
+    assert [r['city'] for r in schedules['UP_701']['data']['routes']] == ['Dhaka', 'Airport']
+    assert calls == [3, 3]
+
+
+def test_schedule_cache_invalidated_by_added_or_removed_file(data_dir, monkeypatch):
+    calls = count_parses(monkeypatch)
+    DataLoader(data_dir).get_schedules()
+    
+    write_schedule(data_dir, 'NEW_801', ['Dhaka', 'Sylhet'])
+    assert 'NEW_801' in DataLoader(data_dir).get_schedules()
+    
+    os.remove(os.path.join(data_dir, 'schedules', 'DOWN_702.json'))
+    assert set(DataLoader(data_dir).get_schedules()) == {'UP_701', 'LOOP_703', 'NEW_801'}
+    assert calls == [3, 4, 3]
+
+
+def test_schedule_cache_ignores_stale_or_unreadable_cache(data_dir, monkeypatch):
+    cache_file = os.path.join(data_dir, 'schedules.cache.pkl')
+    with open(cache_file, 'wb') as f:
+        pickle.dump(((0, 0, 0), {'STALE': {}}), f)
+    assert 'STALE' not in DataLoader(data_dir).get_schedules()
+    
+    with open(cache_file, 'wb') as f:
+        f.write(b'not a pickle')
+    assert set(DataLoader(data_dir).get_schedules()) == {'UP_701', 'DOWN_702', 'LOOP_703'}
@@ -0,0 +1,79 @@
+"""Tests for the timeline generator's status cache"""
+
+import pytest
+
+import train_timeline_generator
+from train_timeline_generator import TrainTimelineGenerator, clear_status_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(train_timeline_generator.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    clear_status_cache()
+    generator = TrainTimelineGenerator()
+    generator.builds = []
+    
+    def build(train_number):
+        generator.builds.append(train_number)
+        if train_number == 'MISSING':
+            return {'error': 'Train schedule not found'}
+        return {'train_number': train_number, 'build': len(generator.builds)}
+    
+    monkeypatch.setattr(generator, '_build_train_status', build)
+    yield generator
+    clear_status_cache()
+
+
+def test_status_reused_within_ttl(generator, clock):
+    first = generator.generate_train_status('701')
+    clock.now += train_timeline_generator.STATUS_CACHE_SECONDS - 1
+    assert generator.generate_train_status('701') is first
+    assert generator.builds == ['701']
+
+
+def test_status_rebuilt_after_ttl(generator, clock):
+    first = generator.generate_train_status('701')
+    clock.now += train_timeline_generator.STATUS_CACHE_SECONDS
+    second = generator.generate_train_status('701')
+    assert second is not first
+    assert generator.builds == ['701', '701']
+
+
+def test_errors_are_not_cached(generator, clock):
+    assert 'error' in generator.generate_train_status('MISSING')
+    assert 'error' in generator.generate_train_status('MISSING')
+    assert generator.builds == ['MISSING', 'MISSING']
+
+
+def test_least_recently_used_status_is_evicted(generator, clock, monkeypatch):
+    monkeypatch.setattr(train_timeline_generator, 'STATUS_CACHE_SIZE', 2)
+    generator.generate_train_status('701')
+    generator.generate_train_status('702')
+    # Reading 701 makes 702 the least recently used
+    generator.generate_train_status('701')
+    generator.generate_train_status('703')
+    
+    assert list(train_timeline_generator._STATUS_CACHE) == ['701', '703']
+    generator.generate_train_status('702')
+    assert generator.builds == ['701', '702', '703', '702']
+
+
+def test_clear_status_cache(generator, clock):
+    generator.generate_train_status('701')
+    clear_status_cache()
+    generator.generate_train_status('701')
+    assert generator.builds == ['701', '701']
@@ -5,17 +5,24 @@ Provides comprehensive train tracking, scheduling, and crowd validation services
 """
 
 from flasgger import Swagger
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
 import logging
+import os
+import random
+import threading
+import time
 from datetime import datetime
 import traceback
 
+import json_utils
+from config import Config
+
 # Import our custom modules
 from data_loader import get_data_loader
 from position_calculator import get_position_calculator
 from delay_simulator import get_delay_simulator
-from train_timeline_generator import get_train_timeline_generator
+from train_timeline_generator import clear_status_cache, get_train_timeline_generator
 from crowd_validation import get_crowd_validation
 
 # Configure logging
@@ -65,51 +72,189 @@ delay_simulator = get_delay_simulator()
 timeline_generator = get_train_timeline_generator()
 crowd_validation = get_crowd_validation()
 
+# Data otherwise loads on first use in each worker
+if Config.PRELOAD_DATA:
+    data_loader.load_all_data()
+    timeline_generator.build_route_plans()
+
+# Background maintenance runs about this often, jittered so workers don't align
+JANITOR_INTERVAL_SECONDS = 60
+JANITOR_JITTER_SECONDS = 10
+
+_janitor_pid = None
+_janitor_lock = threading.Lock()
+
+def run_janitor():
+    """Prune old crowd validations and pick up changed data files off the request path"""
+    while True:
+        time.sleep(JANITOR_INTERVAL_SECONDS + random.uniform(0, JANITOR_JITTER_SECONDS))
+        try:
+            crowd_validation.cleanup_old_validations()
+            data_loader.status_snapshot()
+        except Exception as e:
+            logger.error(f"Janitor error: {e}")
+
+@app.before_request
+def ensure_janitor():
+    """Start the janitor on the first request in each process"""
+    # Started lazily rather than at import so a preloading master never forks
+    # while the janitor holds a lock; the pid check restarts it in each worker
+    global _janitor_pid
+    if _janitor_pid == os.getpid():
+        return
+    with _janitor_lock:
+        if _janitor_pid != os.getpid():
+            threading.Thread(target=run_janitor, name="janitor", daemon=True).start()
+            _janitor_pid = os.getpid()
+
+# Status payloads polled by dashboards are rebuilt at most this often
+STATUS_CACHE_SECONDS = 1.0
+_status_cache = {}
+
+# Read-mostly responses may be served from the reverse proxy's cache for this long
+PUBLIC_CACHE_SECONDS = 30
+
+# Train summaries keyed by train number, tagged with the data version they were built from
+_summary_cache = {}
+
+# Response timestamps have one-second resolution, so the formatted string is reused within a second
+_iso_now_cache = (0, '')
+
+def iso_now():
+    """Get the current local time as an ISO string, formatted at most once per second"""
+    global _iso_now_cache
+    now = int(time.time())
+    cached = _iso_now_cache
+    if cached[0] == now:
+        return cached[1]
+
+    timestamp = datetime.fromtimestamp(now).isoformat()
+    _iso_now_cache = (now, timestamp)
+    return timestamp
+
+def json_response(payload, status=200):
+    """Serialize a payload with the fast JSON encoder into a Flask response"""
+    return Response(json_utils.dumps(payload), status=status, mimetype='application/json')
+
+def json_response_spliced(payload, encoded_fields, status=200):
+    """Serialize a payload, splicing in fields whose values are already encoded JSON bytes"""
+    parts = [b'"%s":%s' % (key.encode(), value) for key, value in encoded_fields.items()]
+    body = json_utils.dumps(payload)
+    if body != b'{}':
+        parts.append(body[1:-1])
+    return Response(b'{' + b','.join(parts) + b'}', status=status, mimetype='application/json')
+
+def cacheable(response, max_age=PUBLIC_CACHE_SECONDS):
+    """Let the reverse proxy cache a read-mostly response"""
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+def encode_schedules(results):
+    """Join the cached schedule encodings of search results into a JSON array"""
+    return b'[' + b','.join(data_loader.get_schedule_json(r['train_key'], r['schedule']) for r in results) + b']'
+
+def get_cached_status(key, build):
+    """Return a recently built status payload, rebuilding it once the TTL expires"""
+    cached = _status_cache.get(key)
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < STATUS_CACHE_SECONDS:
+        return cached[1]
+
+    payload = build()
+    _status_cache[key] = (now, payload)
+    return payload
+
+def build_health_payload():
+    """Build the health check payload"""
+    data_status = data_loader.status_snapshot()
+    total_trains, _, active_confirmations = crowd_validation.counters()
+    return {
+        "status": "healthy",
+        "timestamp": iso_now(),
+        "version": "2.0.0",
+        "data_sources": data_status,
+        "crowd_validations": {
+            "total_trains": total_trains,
+            "active_validations": active_confirmations
+        },
+        "modules": {
+            "data_loader": "active",
+            "position_calculator": "active",
+            "delay_simulator": "active",
+            "timeline_generator": "active",
+            "crowd_validation": "active"
+        }
+    }
+
+def build_system_status_payload():
+    """Build the admin system status payload"""
+    data_loader.status_snapshot()
+    total_trains, total_confirmations, active_confirmations = crowd_validation.counters()
+    system_status = {
+        "data_sources": {
+            "schedules": len(data_loader.get_schedules()),
+            "stations": len(data_loader.get_stations()),
+            "segments": len(data_loader.get_segments()),
+            "route_mappings": len(data_loader.get_route_mappings())
+        },
+        "crowd_validations": {
+            "total_trains": total_trains,
+            "total_confirmations": total_confirmations,
+            "active_confirmations": active_confirmations
+        },
+        "last_updated": iso_now()
+    }
+    return {"success": True, "system_status": system_status}
+
+def build_train_summary(train_number, schedule):
+    """Build the schedule-derived part of a train summary"""
+    routes = schedule.get('data', {}).get('routes', [])
+    total_distance = position_calculator.calculate_total_route_distance(
+        [route['city'] for route in routes]
+    )
+    return {
+        'train_number': train_number,
+        'train_name': schedule.get('data', {}).get('train_name', 'Unknown'),
+        'operating_days': schedule.get('data', {}).get('days', []),
+        'total_stations': len(routes),
+        'route_summary': {
+            'origin': routes[0]['city'] if routes else 'Unknown',
+            'destination': routes[-1]['city'] if routes else 'Unknown',
+            'total_distance': round(total_distance, 2)
+        },
+        'schedule_info': {
+            'departure_time': routes[0].get('departure_time') if routes else None,
+            'arrival_time': routes[-1].get('arrival_time') if routes else None
+        }
+    }
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint with system status"""
     try:
-        data_status = data_loader.load_all_data()
-        crowd_summary = crowd_validation.get_all_train_validations()
-        return jsonify({
-            "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "version": "2.0.0",
-            "data_sources": data_status,
-            "crowd_validations": {
-                "total_trains": len(crowd_summary),
-                "active_validations": sum(data.get('active_confirmations', 0) for data in crowd_summary.values())
-            },
-            "modules": {
-                "data_loader": "active",
-                "position_calculator": "active",
-                "delay_simulator": "active",
-                "timeline_generator": "active",
-                "crowd_validation": "active"
-            }
-        })
+        return json_response(get_cached_status('health', build_health_payload))
     except Exception as e:
         logger.error(f"Health check error: {e}")
-        return jsonify({
+        return json_response({
             "status": "unhealthy",
             "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }), 500
+            "timestamp": iso_now()
+        }, 500)
 
 @app.route('/api/stations', methods=['GET'])
 def get_stations():
     """Get all stations with coordinates"""
     try:
+        # The station list is large and rarely changes, so splice in its cached encoding
         stations = data_loader.get_stations()
-        return jsonify({
+        return cacheable(json_response_spliced({
             "success": True,
-            "stations": stations,
             "total_count": len(stations),
-            "timestamp": datetime.now().isoformat()
-        })
+            "timestamp": iso_now()
+        }, {"stations": data_loader.get_stations_json()}))
     except Exception as e:
         logger.error(f"Error getting stations: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/trains/search', methods=['GET'])
 def search_trains():
@@ -121,35 +266,33 @@ def search_trains():
 
         if train_number:
             results = data_loader.search_trains_by_number(train_number)
-            return jsonify({
+            return json_response_spliced({
                 "success": True,
                 "search_type": "train_number",
                 "query": train_number,
-                "results": [r['schedule'] for r in results],
                 "total_count": len(results),
-                "timestamp": datetime.now().isoformat()
-            })
+                "timestamp": iso_now()
+            }, {"results": encode_schedules(results)})
 
         elif from_station and to_station:
             results = data_loader.search_trains_by_stations(from_station, to_station)
-            return jsonify({
+            return json_response_spliced({
                 "success": True,
                 "search_type": "station_to_station",
                 "from_station": from_station,
                 "to_station": to_station,
-                "results": [r['schedule'] for r in results],
                 "total_count": len(results),
-                "timestamp": datetime.now().isoformat()
-            })
+                "timestamp": iso_now()
+            }, {"results": encode_schedules(results)})
 
-        return jsonify({
+        return json_response({
             "success": False,
             "error": "Invalid search parameters. Use 'from'+'to' or 'number'."
-        }), 400
+        }, 400)
 
     except Exception as e:
         logger.error(f"Error searching trains: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/trains/<train_number>/status', methods=['GET'])
 def get_train_status(train_number):
@@ -157,22 +300,22 @@ def get_train_status(train_number):
     try:
         status_data = timeline_generator.generate_train_status(train_number)
         if 'error' in status_data:
-            return jsonify({"success": False, "error": status_data['error']}), 404
+            return json_response({"success": False, "error": status_data['error']}, 404)
 
         adjusted_status = crowd_validation.adjust_train_status_with_crowd_data(
             train_number, status_data
         )
 
-        return jsonify({
+        return json_response({
             "success": True,
             "train_number": train_number,
             "status": adjusted_status,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         })
 
     except Exception as e:
         logger.error(f"Error getting train status for {train_number}: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/trains/<train_number>/confirm', methods=['POST'])
 def confirm_user_on_train(train_number):
@@ -184,16 +327,16 @@ def confirm_user_on_train(train_number):
         coordinates = data.get('coordinates')
 
         if not user_id:
-            return jsonify({"success": False, "error": "User ID is required"}), 400
+            return json_response({"success": False, "error": "User ID is required"}, 400)
 
         result = crowd_validation.confirm_user_on_train(
             train_number, user_id, station_name, coordinates
         )
-        return jsonify(result)
+        return json_response(result)
 
     except Exception as e:
         logger.error(f"Error confirming user on train {train_number}: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/trains/<train_number>/crowd-data', methods=['GET'])
 def get_train_crowd_data(train_number):
@@ -201,94 +344,64 @@ def get_train_crowd_data(train_number):
     try:
         crowd_data = crowd_validation.get_train_crowd_data(train_number)
         if 'error' in crowd_data:
-            return jsonify({"success": False, "error": crowd_data['error']}), 404
-        return jsonify({
+            return json_response({"success": False, "error": crowd_data['error']}, 404)
+        return json_response({
             "success": True,
             "train_number": train_number,
             "crowd_data": crowd_data,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         })
 
     except Exception as e:
         logger.error(f"Error getting crowd data for train {train_number}: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/trains/<train_number>/summary', methods=['GET'])
 def get_train_summary(train_number):
     """Get a summary of train information"""
     try:
-        schedule = data_loader.get_schedule_by_train(train_number)
-        if not schedule:
-            return jsonify({"success": False, "error": "Train schedule not found"}), 404
-
-        routes = schedule.get('data', {}).get('routes', [])
-        total_distance = 0.0
-        if len(routes) > 1:
-            for i in range(len(routes) - 1):
-                total_distance += position_calculator.calculate_distance_between_stations(
-                    routes[i]['city'], routes[i + 1]['city']
-                )
-
-        summary = {
-            'train_number': train_number,
-            'train_name': schedule.get('data', {}).get('train_name', 'Unknown'),
-            'operating_days': schedule.get('data', {}).get('days', []),
-            'total_stations': len(routes),
-            'route_summary': {
-                'origin': routes[0]['city'] if routes else 'Unknown',
-                'destination': routes[-1]['city'] if routes else 'Unknown',
-                'total_distance': round(total_distance, 2)
-            },
-            'schedule_info': {
-                'departure_time': routes[0].get('departure_time') if routes else None,
-                'arrival_time': routes[-1].get('arrival_time') if routes else None
-            },
-            'crowd_data': crowd_validation.get_train_crowd_data(train_number)
-        }
+        version = data_loader.version
+        cached = _summary_cache.get(train_number)
+        if cached is not None and cached[0] == version:
+            summary = cached[1]
+        else:
+            schedule = data_loader.get_schedule_by_train(train_number)
+            if not schedule:
+                return json_response({"success": False, "error": "Train schedule not found"}, 404)
+            summary = build_train_summary(train_number, schedule)
+            _summary_cache[train_number] = (version, summary)
+
+        # Crowd data changes independently of the schedule, so it is never cached
+        summary = {**summary, 'crowd_data': crowd_validation.get_train_crowd_data(train_number)}
 
-        return jsonify({
+        return json_response({
             "success": True,
             "train_number": train_number,
             "summary": summary,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         })
 
     except Exception as e:
         logger.error(f"Error getting train summary for {train_number}: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/stations/<station_name>/trains', methods=['GET'])
 def get_trains_at_station(station_name):
     """Get all trains that pass through a specific station"""
     try:
-        schedules = data_loader.get_schedules()
-        trains_at_station = []
-        for train_key, schedule in schedules.items():
-            routes = schedule.get('data', {}).get('routes', [])
-            route_stations = [r['city'] for r in routes]
-            if station_name in route_stations:
-                idx = route_stations.index(station_name)
-                station_info = routes[idx]
-                trains_at_station.append({
-                    'train_number': train_key,
-                    'train_name': schedule.get('data', {}).get('train_name', 'Unknown'),
-                    'arrival_time': station_info.get('arrival_time'),
-                    'departure_time': station_info.get('departure_time'),
-                    'halt_duration': station_info.get('halt', '---'),
-                    'operating_days': schedule.get('data', {}).get('days', [])
-                })
-
-        return jsonify({
+        trains_at_station = [stop._asdict() for stop in data_loader.get_trains_at_station(station_name)]
+
+        return json_response({
             "success": True,
             "station_name": station_name,
             "trains": trains_at_station,
             "total_count": len(trains_at_station),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         })
 
     except Exception as e:
         logger.error(f"Error getting trains at station {station_name}: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/analytics/delays', methods=['GET'])
 def get_delay_analytics():
@@ -299,76 +412,63 @@ def get_delay_analytics():
 
         if train_number and station_name:
             stats = delay_simulator.get_historical_delay_stats(train_number, station_name)
-            return jsonify({
+            return json_response({
                 "success": True,
                 "analytics_type": "train_station_delays",
                 "train_number": train_number,
                 "station_name": station_name,
                 "stats": stats,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             })
         elif train_number:
             stats = delay_simulator.get_historical_delay_stats(train_number)
-            return jsonify({
+            return json_response({
                 "success": True,
                 "analytics_type": "train_delays",
                 "train_number": train_number,
                 "stats": stats,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             })
         else:
-            return jsonify({
+            return json_response({
                 "success": True,
                 "analytics_type": "overall_delays",
                 "stats": {"total_trains": len(data_loader.get_all_train_numbers())},
-                "timestamp": datetime.now().isoformat()
+                "timestamp": iso_now()
             })
 
     except Exception as e:
         logger.error(f"Error getting delay analytics: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/admin/refresh-data', methods=['POST'])
 def refresh_data():
     """Admin endpoint to refresh all data"""
     try:
         data_status = data_loader.load_all_data(force_reload=True)
+        _summary_cache.clear()
+        timeline_generator.build_route_plans()
+        clear_status_cache()
         cleaned_count = crowd_validation.cleanup_old_validations()
-        return jsonify({
+        return json_response({
             "success": True,
             "message": "Data refreshed successfully",
             "data_status": data_status,
             "cleaned_validations": cleaned_count,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": iso_now()
         })
     except Exception as e:
         logger.error(f"Error refreshing data: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 @app.route('/api/admin/system-status', methods=['GET'])
 def get_system_status():
     """Get comprehensive system status"""
     try:
-        data_status = data_loader.load_all_data()
-        crowd_summary = crowd_validation.get_all_train_validations()
-        system_status = {
-            "data_sources": {
-                "schedules": len(data_loader.get_schedules()),
-                "stations": len(data_loader.get_stations()),
-                "segments": len(data_loader.get_segments()),
-                "route_mappings": len(data_loader.get_route_mappings())
-            },
-            "crowd_validations": {
-                "total_trains": len(crowd_summary),
-                "total_confirmations": sum(d.get('total_confirmations', 0) for d in crowd_summary.values()),
-                "active_confirmations": sum(d.get('active_confirmations', 0) for d in crowd_summary.values())
-            },
-            "last_updated": datetime.now().isoformat()
-        }
-        return jsonify({"success": True, "system_status": system_status})
+        return json_response(get_cached_status('system_status', build_system_status_payload))
     except Exception as e:
         logger.error(f"Error getting system status: {e}")
-        return jsonify({"success": False, "error": str(e)}), 500
+        return json_response({"success": False, "error": str(e)}, 500)
 
 # 📄 Docs endpoint
 @app.route('/docs', methods=['GET'])
@@ -380,27 +480,41 @@ def docs():
       200:
         description: Swagger UI redirect info
     """
-    return jsonify({
+    return json_response({
         "success": True,
         "message": "Swagger UI available at /apidocs",
         "docs_url": "/apidocs",
-        "generated_at": datetime.now().isoformat()
+        "generated_at": iso_now()
     })
 
+# Repeats of the same unhandled error log their traceback at most this often
+TRACEBACK_REPEAT_SECONDS = 5.0
+TRACEBACK_SIGNATURE_LIMIT = 1000
+_traceback_log_times = {}
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"success": False, "error": "Endpoint not found", "timestamp": datetime.now().isoformat()}), 404
+    return json_response({"success": False, "error": "Endpoint not found", "timestamp": iso_now()}, 404)
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({"success": False, "error": "Internal server error", "timestamp": datetime.now().isoformat()}), 500
+    return json_response({"success": False, "error": "Internal server error", "timestamp": iso_now()}, 500)
 
 @app.errorhandler(Exception)
 def handle_exception(e):
     logger.error(f"Unhandled exception: {e}")
-    logger.error(traceback.format_exc())
-    return jsonify({"success": False, "error": "Unexpected error", "timestamp": datetime.now().isoformat()}), 500
+
+    # Only format the traceback when this error hasn't been logged recently
+    signature = f"{type(e).__name__}:{str(e)[:80]}"
+    now = time.monotonic()
+    if now - _traceback_log_times.get(signature, float('-inf')) > TRACEBACK_REPEAT_SECONDS:
+        if len(_traceback_log_times) >= TRACEBACK_SIGNATURE_LIMIT:
+            _traceback_log_times.clear()
+        _traceback_log_times[signature] = now
+        logger.error(traceback.format_exc())
+
+    return json_response({"success": False, "error": "Unexpected error", "timestamp": iso_now()}, 500)
 
 if __name__ == '__main__':
     logger.info("Starting TrainJatri Backend API...")
@@ -5,7 +5,14 @@ Generates comprehensive train status timelines
 """
 
 import logging
-from typing import Dict, List, Any, Optional
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from data_loader import get_data_loader
 from position_calculator import get_position_calculator
@@ -13,6 +20,77 @@ from delay_simulator import get_delay_simulator
 
 logger = logging.getLogger(__name__)
 
+# Stations whose names mark them as major hubs for crowd estimates
+MAJOR_STATIONS = ('Dhaka', 'Chattogram', 'Rajshahi', 'Khulna', 'Sylhet')
+_MAJOR_STATION_RE = re.compile('|'.join(map(re.escape, MAJOR_STATIONS)))
+
+# A train's route as parallel per-station columns, with times already parsed
+RoutePlan = namedtuple(
+    'RoutePlan',
+    'station_names crowd_levels delay_factors arrival_clocks departure_clocks latest_departures '
+    'cumulative_distances rounded_distances halts durations'
+)
+
+# Route plan per train, reused until the loader hands out a new schedule object
+_ROUTE_PLAN_CACHE: Dict[str, Tuple[Dict[str, Any], RoutePlan]] = {}
+
+# Clients poll live status far more often than the simulated timeline needs
+# to change, so a generated status is served for this long
+STATUS_CACHE_SECONDS = 10.0
+STATUS_CACHE_SIZE = 512
+
+# Most recently generated status per train, oldest first
+_STATUS_CACHE: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_status_cache_lock = threading.Lock()
+
+MINUTES_PER_DAY = 24 * 60
+
+# Scheduled times fall on whole minutes, so one day's ISO strings are formatted once
+_minute_iso_cache: Tuple[int, Tuple[str, ...]] = (0, ())
+
+@lru_cache(maxsize=2048)
+def _parse_clock(time_str: str) -> Optional[Tuple[int, int]]:
+    """Parse a schedule time string such as '7:45 AM BST' into (hour, minute)"""
+    time_part = time_str.replace(' BST', '').strip()
+    
+    # Schedules use 'H:MM am' throughout, which is cheap to split by hand
+    hour_str, colon, rest = time_part.partition(':')
+    minute_str, _, meridiem = rest.partition(' ')
+    meridiem = meridiem.upper()
+    if (colon and 0 < len(hour_str) <= 2 and len(minute_str) == 2 and meridiem in ('AM', 'PM')
+            and (hour_str + minute_str).isascii() and (hour_str + minute_str).isdigit()):
+        hour = int(hour_str)
+        minute = int(minute_str)
+        if 1 <= hour <= 12 and minute < 60:
+            return hour % 12 + (12 if meridiem == 'PM' else 0), minute
+    
+    # Leave anything unusual to strptime so it is accepted or rejected as before
+    try:
+        time_obj = datetime.strptime(time_part, '%I:%M %p')
+        return time_obj.hour, time_obj.minute
+    except Exception:
+        return None
+
+def _minute_iso_strings(day: datetime) -> Tuple[str, ...]:
+    """Get ISO strings for every minute of a day, indexed by hour * 60 + minute"""
+    global _minute_iso_cache
+    ordinal = day.toordinal()
+    cached = _minute_iso_cache
+    if cached[0] == ordinal:
+        return cached[1]
+    
+    date_prefix = day.date().isoformat()
+    minute_isos = tuple(
+        f"{date_prefix}T{hour:02d}:{minute:02d}:00" for hour in range(24) for minute in range(60)
+    )
+    _minute_iso_cache = (ordinal, minute_isos)
+    return minute_isos
+
+def clear_status_cache():
+    """Drop every cached train status"""
+    with _status_cache_lock:
+        _STATUS_CACHE.clear()
+
 class TrainTimelineGenerator:
     """Generates comprehensive train status timelines"""
     
@@ -20,8 +98,32 @@ class TrainTimelineGenerator:
         self.data_loader = get_data_loader()
         self.position_calculator = get_position_calculator(self.data_loader)
         self.delay_simulator = get_delay_simulator()
+        
+        # Crowd level for every (hour, is_major) pair, indexed by hour * 2 + is_major
+        self._crowd_levels = tuple(
+            self._compute_crowd_level(hour, is_major)
+            for hour in range(24) for is_major in (False, True)
+        )
     
     def generate_train_status(self, train_number: str) -> Dict[str, Any]:
+        """Generate complete train status with timeline, reusing one generated in the last few seconds"""
+        now = time.monotonic()
+        with _status_cache_lock:
+            cached = _STATUS_CACHE.get(train_number)
+            if cached is not None and now - cached[0] < STATUS_CACHE_SECONDS:
+                _STATUS_CACHE.move_to_end(train_number)
+                return cached[1]
+        
+        status_data = self._build_train_status(train_number)
+        if 'error' not in status_data:
+            with _status_cache_lock:
+                _STATUS_CACHE[train_number] = (now, status_data)
+                _STATUS_CACHE.move_to_end(train_number)
+                while len(_STATUS_CACHE) > STATUS_CACHE_SIZE:
+                    _STATUS_CACHE.popitem(last=False)
+        return status_data
+    
+    def _build_train_status(self, train_number: str) -> Dict[str, Any]:
         """Generate complete train status with timeline"""
         try:
             schedule = self.data_loader.get_schedule_by_train(train_number)
@@ -29,10 +131,10 @@ class TrainTimelineGenerator:
                 return {"error": "Train schedule not found"}
             
             current_time = datetime.now()
-            routes = schedule.get('data', {}).get('routes', [])
+            plan = self._get_route_plan(train_number, schedule)
             
             # Generate station statuses
-            station_statuses = self._generate_station_statuses(routes, current_time)
+            station_statuses, total_delay = self._generate_station_statuses(plan, current_time)
             
             # Calculate position and metrics
             position_info = self.position_calculator.calculate_train_position(
@@ -51,7 +153,7 @@ class TrainTimelineGenerator:
                 'current_speed': current_speed,
                 'distance_covered': position_info.get('distance_covered', 0),
                 'distance_to_next': position_info.get('distance_to_next', 0),
-                'delay_minutes': self._calculate_total_delay(station_statuses),
+                'delay_minutes': total_delay,
                 'estimated_arrival': position_info.get('eta_to_next', 'Unknown'),
                 'progress_percentage': position_info.get('progress_percentage', 0),
                 'current_station': position_info.get('current_station', 'Unknown'),
@@ -66,188 +168,236 @@ class TrainTimelineGenerator:
             logger.error(f"Error generating train status: {e}")
             return {"error": str(e)}
     
-    def _generate_station_statuses(self, routes: List[Dict[str, Any]], current_time: datetime) -> List[Dict[str, Any]]:
-        """Generate status for each station"""
+    def build_route_plans(self) -> int:
+        """Build route plans for every loaded train, parsing each distinct time string once"""
         try:
-            station_statuses = []
-            
-            for i, route in enumerate(routes):
-                station_name = route['city']
-                status = self._determine_station_status(i, routes, current_time)
-                
-                # Parse times and simulate delays
-                scheduled_arrival = self._parse_time_string(route.get('arrival_time'))
-                scheduled_departure = self._parse_time_string(route.get('departure_time'))
-                
-                delay_info = self._simulate_station_delays(
-                    station_name, scheduled_arrival, scheduled_departure, current_time
-                )
-                
-                # Calculate distance
-                distance_from_start = self._calculate_distance_from_start(routes, i)
-                
-                station_status = {
-                    'station_name': station_name,
-                    'status': status,
-                    'scheduled_arrival': scheduled_arrival.isoformat() if scheduled_arrival else None,
-                    'scheduled_departure': scheduled_departure.isoformat() if scheduled_departure else None,
-                    'actual_arrival': delay_info.get('actual_arrival'),
-                    'actual_departure': delay_info.get('actual_departure'),
-                    'delay_minutes': delay_info.get('delay_minutes', 0),
-                    'halt_duration': route.get('halt', '---'),
-                    'duration': route.get('duration', '---'),
-                    'distance_from_start': round(distance_from_start, 2),
-                    'weather_condition': self.delay_simulator.get_weather_condition(station_name),
-                    'crowd_level': self._estimate_crowd_level(station_name, scheduled_arrival)
-                }
-                
-                station_statuses.append(station_status)
+            schedules = self.data_loader.get_schedules()
+            time_strs = {
+                route.get(time_field)
+                for schedule in schedules.values()
+                for route in schedule.get('data', {}).get('routes', [])
+                for time_field in ('arrival_time', 'departure_time')
+            }
+            clocks = {time_str: self._parse_clock(time_str) for time_str in time_strs}
             
-            return station_statuses
+            plans = {
+                train_number: (schedule, self._build_route_plan(schedule, clocks))
+                for train_number, schedule in schedules.items()
+            }
+            _ROUTE_PLAN_CACHE.clear()
+            _ROUTE_PLAN_CACHE.update(plans)
             
-        except Exception as e:
-            logger.error(f"Error generating station statuses: {e}")
-            return []
-    
-    def _determine_station_status(self, station_idx: int, routes: List[Dict[str, Any]], 
-                                 current_time: datetime) -> str:
-        """Determine station status"""
-        try:
-            current_position = self._find_current_position(routes, current_time)
-            
-            if station_idx < current_position:
-                return 'completed'
-            elif station_idx == current_position:
-                return 'current'
-            elif station_idx == current_position + 1:
-                return 'next'
-            else:
-                return 'upcoming'
-                
-        except Exception as e:
-            return 'upcoming'
-    
-    def _find_current_position(self, routes: List[Dict[str, Any]], current_time: datetime) -> int:
-        """Find current train position"""
-        try:
-            for i, route in enumerate(routes):
-                if 'departure_time' in route and route['departure_time']:
-                    departure_time = self._parse_time_string(route['departure_time'])
-                    if departure_time and departure_time > current_time:
-                        return max(0, i - 1)
-            return len(routes) - 1
+            logger.info(f"Built route plans for {len(plans)} trains from {len(clocks)} distinct times")
+            return len(plans)
             
         except Exception as e:
+            logger.error(f"Error building route plans: {e}")
             return 0
     
-    def _simulate_station_delays(self, station_name: str, scheduled_arrival: datetime, 
-                                scheduled_departure: datetime, current_time: datetime) -> Dict[str, Any]:
-        """Simulate station delays"""
+    def _get_route_plan(self, train_number: str, schedule: Dict[str, Any]) -> RoutePlan:
+        """Get a train's routes with their times already parsed, building it once per schedule"""
+        cached = _ROUTE_PLAN_CACHE.get(train_number)
+        if cached is not None and cached[0] is schedule:
+            return cached[1]
+        
+        plan = self._build_route_plan(schedule)
+        _ROUTE_PLAN_CACHE[train_number] = (schedule, plan)
+        return plan
+    
+    def _build_route_plan(self, schedule: Dict[str, Any],
+                          clocks: Optional[Dict[str, Optional[Tuple[int, int]]]] = None) -> RoutePlan:
+        """Split a schedule's routes into per-station columns, using pre-parsed clocks when given"""
+        parse_clock = clocks.__getitem__ if clocks is not None else self._parse_clock
+        routes = schedule.get('data', {}).get('routes', [])
+        station_names = tuple(route['city'] for route in routes)
+        arrival_clocks = tuple(parse_clock(route.get('arrival_time')) for route in routes)
+        departure_clocks = tuple(parse_clock(route.get('departure_time')) for route in routes)
+        cumulative_distances = self._build_cumulative_distances(routes)
+        return RoutePlan(
+            station_names=station_names,
+            # Crowd levels only depend on the station and its scheduled arrival hour
+            crowd_levels=tuple(map(
+                self._estimate_crowd_level, map(self._is_major_station, station_names), arrival_clocks
+            )),
+            delay_factors=tuple(self.delay_simulator.get_station_factors(station_names)),
+            arrival_clocks=arrival_clocks,
+            departure_clocks=departure_clocks,
+            latest_departures=self._build_latest_departures(departure_clocks),
+            cumulative_distances=cumulative_distances,
+            rounded_distances=tuple(round(distance, 2) for distance in cumulative_distances),
+            halts=tuple(route.get('halt', '---') for route in routes),
+            durations=tuple(route.get('duration', '---') for route in routes)
+        )
+    
+    def _generate_station_statuses(self, plan: RoutePlan,
+                                   current_time: datetime) -> Tuple[List[Dict[str, Any]], int]:
+        """Generate status for each station, along with the largest station delay"""
         try:
-            weather = self.delay_simulator.get_weather_condition(station_name)
+            station_names = plan.station_names
+            # Place every scheduled time on the request's own day without asking the clock again
+            today_base = current_time.replace(hour=0, minute=0, second=0, microsecond=0)
+            to_datetime = self._clock_to_datetime
+            scheduled_arrivals = [to_datetime(clock, today_base) for clock in plan.arrival_clocks]
+            scheduled_departures = [to_datetime(clock, today_base) for clock in plan.departure_clocks]
             
-            arrival_delay = 0
-            actual_arrival = scheduled_arrival
-            if scheduled_arrival:
-                arrival_delay_info = self.delay_simulator.simulate_delay(
-                    'STATION_SIMULATION', station_name, scheduled_arrival, current_time, weather
-                )
-                arrival_delay = arrival_delay_info.get('delay_minutes', 0)
-                if arrival_delay > 0:
-                    actual_arrival = scheduled_arrival + timedelta(minutes=arrival_delay)
-            
-            departure_delay = 0
-            actual_departure = scheduled_departure
-            if scheduled_departure:
-                departure_delay_info = self.delay_simulator.simulate_delay(
-                    'STATION_SIMULATION', station_name, scheduled_departure, current_time, weather
-                )
-                departure_delay = departure_delay_info.get('delay_minutes', 0)
-                if departure_delay > 0:
-                    actual_departure = scheduled_departure + timedelta(minutes=departure_delay)
+            # The position only depends on the clock, so locate it once for every station
+            current_position = self._find_current_position(plan, current_time)
+            statuses = self._determine_station_statuses(len(station_names), current_position)
             
-            total_delay = max(arrival_delay, departure_delay)
+            # Draw each station's weather once and use it for both its delays and its status
+            delay_simulator = self.delay_simulator
+            locations = list(dict.fromkeys(station_names))
+            weather_by_station = dict(zip(locations, delay_simulator.get_weather_conditions(locations)))
+            weathers = [weather_by_station[station_name] for station_name in station_names]
             
-            return {
-                'delay_minutes': total_delay,
-                'actual_arrival': actual_arrival.isoformat() if actual_arrival else None,
-                'actual_departure': actual_departure.isoformat() if actual_departure else None,
-                'weather_condition': weather
-            }
+            # Simulate arrival and departure delays for the whole route in two batches
+            arrival_delays = delay_simulator.simulate_delays_batch(
+                'STATION_SIMULATION', station_names, scheduled_arrivals, current_time, weathers,
+                plan.delay_factors
+            )
+            departure_delays = delay_simulator.simulate_delays_batch(
+                'STATION_SIMULATION', station_names, scheduled_departures, current_time, weathers,
+                plan.delay_factors
+            )
+            station_delays = list(map(max, arrival_delays, departure_delays))
             
-        except Exception as e:
-            return {
-                'delay_minutes': 0,
-                'actual_arrival': scheduled_arrival.isoformat() if scheduled_arrival else None,
-                'actual_departure': scheduled_departure.isoformat() if scheduled_departure else None,
-                'weather_condition': 'clear'
-            }
-    
-    def _calculate_distance_from_start(self, routes: List[Dict[str, Any]], station_idx: int) -> float:
-        """Calculate distance from start"""
-        try:
-            if station_idx == 0:
-                return 0.0
+            # Format scheduled and actual times from the day's preformatted minutes
+            minute_isos = _minute_iso_strings(today_base)
+            format_time = self._format_clock_time
+            arrival_clocks = plan.arrival_clocks
+            departure_clocks = plan.departure_clocks
+            scheduled_arrival_isos = [format_time(clock, 0, minute_isos, today_base) for clock in arrival_clocks]
+            scheduled_departure_isos = [format_time(clock, 0, minute_isos, today_base) for clock in departure_clocks]
+            actual_arrival_isos = [
+                format_time(clock, delay, minute_isos, today_base)
+                for clock, delay in zip(arrival_clocks, arrival_delays)
+            ]
+            actual_departure_isos = [
+                format_time(clock, delay, minute_isos, today_base)
+                for clock, delay in zip(departure_clocks, departure_delays)
+            ]
             
-            total_distance = 0.0
-            for i in range(station_idx):
-                if i + 1 < len(routes):
-                    distance = self.position_calculator.calculate_distance_between_stations(
-                        routes[i]['city'], routes[i + 1]['city']
-                    )
-                    total_distance += distance
+            # Build each column for the whole route, then zip them into one dict per station
+            station_statuses = [
+                {
+                    'station_name': station_name,
+                    'status': status,
+                    'scheduled_arrival': scheduled_arrival,
+                    'scheduled_departure': scheduled_departure,
+                    'actual_arrival': actual_arrival,
+                    'actual_departure': actual_departure,
+                    'delay_minutes': delay_minutes,
+                    'halt_duration': halt_duration,
+                    'duration': duration,
+                    'distance_from_start': distance_from_start,
+                    'weather_condition': weather_condition,
+                    'crowd_level': crowd_level
+                }
+                for (station_name, status, scheduled_arrival, scheduled_departure, actual_arrival,
+                     actual_departure, delay_minutes, halt_duration, duration, distance_from_start,
+                     weather_condition, crowd_level) in zip(
+                    station_names,
+                    statuses,
+                    scheduled_arrival_isos,
+                    scheduled_departure_isos,
+                    actual_arrival_isos,
+                    actual_departure_isos,
+                    station_delays,
+                    plan.halts,
+                    plan.durations,
+                    plan.rounded_distances,
+                    weathers,
+                    plan.crowd_levels
+                )
+            ]
             
-            return total_distance
+            return station_statuses, max(station_delays, default=0)
             
         except Exception as e:
-            return 0.0
+            logger.error(f"Error generating station statuses: {e}")
+            return [], 0
+    
+    def _determine_station_statuses(self, station_count: int, current_position: int) -> List[str]:
+        """Determine the status of every station from the train's current position"""
+        statuses = ['completed'] * max(0, current_position) + ['current', 'next'][max(0, -current_position):]
+        statuses.extend(['upcoming'] * (station_count - len(statuses)))
+        return statuses[:station_count]
+    
+    def _build_latest_departures(self, departure_clocks: Tuple[Optional[Tuple[int, int]], ...]) -> Tuple[int, ...]:
+        """Running maximum of departure minutes-of-day, which stays sorted even across midnight"""
+        latest = -1
+        latest_departures = []
+        for clock in departure_clocks:
+            if clock is not None:
+                latest = max(latest, clock[0] * 60 + clock[1])
+            latest_departures.append(latest)
+        return tuple(latest_departures)
     
-    def _calculate_total_delay(self, station_statuses: List[Dict[str, Any]]) -> int:
-        """Calculate total delay across all stations"""
+    def _find_current_position(self, plan: RoutePlan, current_time: datetime) -> int:
+        """Find current train position"""
+        # The first station whose running latest departure is still ahead of
+        # the clock is the first station with a departure still ahead
+        latest_departures = plan.latest_departures
+        next_idx = bisect_right(latest_departures, current_time.hour * 60 + current_time.minute)
+        if next_idx == len(latest_departures):
+            return next_idx - 1
+        return max(0, next_idx - 1)
+    
+    def _format_clock_time(self, clock: Optional[Tuple[int, int]], delay_minutes: int,
+                           minute_isos: Tuple[str, ...], today_base: datetime) -> Optional[str]:
+        """Format a clock time on today_base, pushed back by a simulated delay"""
+        if clock is None:
+            return None
+        minute_of_day = clock[0] * 60 + clock[1] + max(0, delay_minutes)
+        if minute_of_day < MINUTES_PER_DAY:
+            return minute_isos[minute_of_day]
+        # Delays can carry a late train past midnight
+        return (today_base + timedelta(minutes=minute_of_day)).isoformat()
+    
+    def _build_cumulative_distances(self, routes: List[Dict[str, Any]]) -> Tuple[float, ...]:
+        """Calculate the distance from the first station to every station in a single pass"""
         try:
-            return max([status.get('delay_minutes', 0) for status in station_statuses])
+            distance_between = self.position_calculator.calculate_distance_between_stations
+            segment_distances = [
+                distance_between(routes[i]['city'], routes[i + 1]['city'])
+                for i in range(len(routes) - 1)
+            ]
+            return tuple(accumulate(segment_distances, initial=0.0))
+            
         except Exception as e:
-            return 0
+            logger.error(f"Error calculating route distances: {e}")
+            return (0.0,) * len(routes)
     
-    def _estimate_crowd_level(self, station_name: str, scheduled_time: datetime) -> str:
+    def _is_major_station(self, station_name: str) -> bool:
+        """Check whether a station name contains one of the major hub names"""
+        return _MAJOR_STATION_RE.search(station_name) is not None
+    
+    def _estimate_crowd_level(self, is_major_station: bool, arrival_clock: Optional[Tuple[int, int]]) -> str:
         """Estimate crowd level"""
-        try:
-            if not scheduled_time:
-                return 'normal'
-            
-            hour = scheduled_time.hour
-            major_stations = ['Dhaka', 'Chattogram', 'Rajshahi', 'Khulna', 'Sylhet']
-            is_major_station = any(major in station_name for major in major_stations)
-            
-            if 7 <= hour <= 9 or 17 <= hour <= 19:
-                return 'high' if is_major_station else 'medium'
-            elif 22 <= hour or hour <= 5:
-                return 'low'
-            else:
-                return 'medium' if is_major_station else 'normal'
-                
-        except Exception as e:
+        if arrival_clock is None:
             return 'normal'
+        return self._crowd_levels[arrival_clock[0] * 2 + is_major_station]
     
-    def _parse_time_string(self, time_str: str) -> Optional[datetime]:
-        """Parse time string"""
-        try:
-            if not time_str or time_str == '---':
-                return None
-            
-            time_part = time_str.replace(' BST', '').strip()
-            time_obj = datetime.strptime(time_part, '%I:%M %p')
-            today = datetime.now()
-            parsed_time = today.replace(
-                hour=time_obj.hour,
-                minute=time_obj.minute,
-                second=0,
-                microsecond=0
-            )
-            return parsed_time
-            
-        except Exception as e:
+    def _compute_crowd_level(self, hour: int, is_major_station: bool) -> str:
+        """Map an hour of the day and station size to a crowd level"""
+        if 7 <= hour <= 9 or 17 <= hour <= 19:
+            return 'high' if is_major_station else 'medium'
+        elif 22 <= hour or hour <= 5:
+            return 'low'
+        else:
+            return 'medium' if is_major_station else 'normal'
+    
+    def _parse_clock(self, time_str: str) -> Optional[Tuple[int, int]]:
+        """Parse a schedule time string into (hour, minute)"""
+        if not time_str or time_str == '---':
+            return None
+        return _parse_clock(time_str)
+    
+    def _clock_to_datetime(self, clock: Optional[Tuple[int, int]], today_base: datetime) -> Optional[datetime]:
+        """Place an (hour, minute) clock time on today_base, a datetime at midnight"""
+        if clock is None:
             return None
+        return today_base.replace(hour=clock[0], minute=clock[1])
 
 def get_train_timeline_generator() -> TrainTimelineGenerator:
     """Get timeline generator instance"""